@@ -5,15 +5,29 @@ import json
 import os
 from typing import Optional
 
+try:
+    import orjson
+except ImportError:  # optional: faster cache I/O when installed
+    orjson = None
+
+# Marks a key removed since the last flush/save in _pending
+_DELETED = object()
+
 
 class _GeocodeCacheManager:
     """Thread-safe geocode cache manager."""
 
     _instance = None
     _lock = threading.Lock()
+    # Guards reading the file into _cache and every write to _cache/_pending,
+    # so no caller sees or writes to a half-loaded cache
+    _load_lock = threading.RLock()
 
     def __init__(self, _cache: Optional[dict] = None):
-        self._cache = _cache or {}
+        # __init__ runs on every construction of the singleton; keep the
+        # already-loaded cache unless one is passed in explicitly.
+        if _cache is not None:
+            self._cache = _cache
 
     def __new__(cls):
         if cls._instance is None:
@@ -21,33 +35,112 @@ class _GeocodeCacheManager:
                 if cls._instance is None:
                     cls._instance = super().__new__(cls)
                     cls._instance._cache = {}
+                    cls._instance._loaded = False
+                    # Entries set since the last flush/save, not yet on disk
+                    cls._instance._pending = {}
         return cls._instance
 
-    def load(self) -> None:
-        """Load cache from disk."""
-        path = _geocode_cache_path()
-        if not os.path.exists(path):
-            self._cache = {}
+    def load(self, force: bool = False) -> None:
+        """Load cache from disk.
+
+        Only the first call reads the file; later calls are no-ops because
+        the in-memory cache is authoritative (writes go through `set`).
+        Pass force=True to re-read it. Entries flushed to the journal since
+        the last save are replayed on top of the snapshot, and entries set
+        but not yet written to disk are kept.
+        """
+        if self._loaded and not force:
             return
-        try:
-            with open(path, "r", encoding="utf-8") as fh:
-                self._cache = json.load(fh)
-        except (
-            FileNotFoundError,
-            PermissionError,
-            IOError,
-            OSError,
-            ValueError,
-            TypeError,
-        ):
-            self._cache = {}
+        with self._load_lock:
+            if self._loaded and not force:
+                return
+            self._cache = self._read()
+            self._loaded = True
+
+    def _read(self) -> dict:
+        """Read snapshot + journal from disk, with unsaved entries on top."""
+        path = _geocode_cache_path()
+        data: dict = {}
+        if os.path.exists(path):
+            try:
+                if orjson is not None:
+                    with open(path, "rb") as fh:
+                        data = orjson.loads(fh.read())
+                else:
+                    with open(path, "r", encoding="utf-8") as fh:
+                        data = json.load(fh)
+            except (
+                FileNotFoundError,
+                PermissionError,
+                IOError,
+                OSError,
+                ValueError,
+                TypeError,
+            ):
+                data = {}
+        _replay_journal(_geocode_journal_path(), data)
+        data = _normalize_entries(data)
+        for key, value in self._pending.items():
+            if value is _DELETED:
+                data.pop(key, None)
+            else:
+                data[key] = value
+        return data
+
+    def flush(self) -> None:
+        """Append entries set since the last flush to the journal file.
+
+        Costs O(new entries), unlike `save`, so it suits periodic
+        checkpoints during a long geocoding run.
+        """
+        with self._load_lock:
+            if not self._pending:
+                return
+            lines = b"".join(
+                _dumps_line(["del", key] if value is _DELETED else {key: value})
+                for key, value in self._pending.items()
+            )
+            try:
+                with open(_geocode_journal_path(), "ab") as fh:
+                    fh.write(lines)
+                    fh.flush()
+                    os.fsync(fh.fileno())
+            except (PermissionError, IOError, OSError):
+                print("⚠ Warning: Could not append to geocode cache journal.")
+                return
+            self._pending = {}
 
     def save(self) -> None:
-        """Save cache to disk. Well duh"""
+        """Write the whole cache to disk and clear the journal.
+
+        The snapshot goes to a temp file that is fsynced and renamed over
+        the old one, so a crash never leaves a truncated cache behind. The
+        cache is loaded first so a save never replaces the file with a
+        partial in-memory cache.
+        """
+        self.load()
+        with self._load_lock:
+            self._write()
+
+    def _write(self) -> None:
         path = _geocode_cache_path()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
         try:
-            with open(path, "w", encoding="utf-8") as fh:
-                json.dump(self._cache, fh, ensure_ascii=False, indent=2)
+            if orjson is not None:
+                with open(tmp_path, "wb") as fh:
+                    fh.write(orjson.dumps(self._cache, option=orjson.OPT_INDENT_2))
+                    fh.flush()
+                    os.fsync(fh.fileno())
+            else:
+                with open(tmp_path, "w", encoding="utf-8") as fh:
+                    json.dump(self._cache, fh, ensure_ascii=False, indent=2)
+                    fh.flush()
+                    os.fsync(fh.fileno())
+            os.replace(tmp_path, path)
+            self._pending = {}
+            journal = _geocode_journal_path()
+            if os.path.exists(journal):
+                os.remove(journal)
         except (
             FileNotFoundError,
             PermissionError,
@@ -57,6 +150,8 @@ class _GeocodeCacheManager:
             TypeError,
         ):
             print("⚠ Warning: Could not save geocode cache to disk.")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
             return
 
     def get(self, key: str):
@@ -65,13 +160,94 @@ class _GeocodeCacheManager:
 
     def set(self, key: str, value) -> None:
         """Set value in cache by key."""
-        self._cache[key] = value
+        with self._load_lock:
+            self._cache[key] = value
+            self._pending[key] = value
+
+    def rename(self, old: str, new: str):
+        """Move the entry under `old` to `new` and return it (None if absent).
+
+        Both the removal and the new entry are recorded for the next
+        flush/save.
+        """
+        with self._load_lock:
+            value = self._cache.pop(old, None)
+            if value is None:
+                return None
+            self._cache[new] = value
+            self._pending[old] = _DELETED
+            self._pending[new] = value
+            return value
 
     def get_all(self) -> dict:
         """Fetch all cache."""
         return self._cache
 
 
+def _normalize_entries(cache: dict) -> dict:
+    """Rewrite legacy entries into one shape per key kind.
+
+    Page entries (``page::<id>``) become ``{"coords": {...},
+    "last_edited_time": ...}``; a legacy raw ``{"lat", "lng"}`` page entry
+    gets ``last_edited_time`` None, meaning valid for any edit time. Address
+    entries stored as ``{"coords": {...}}`` are flattened to raw coords.
+    Non-dict entries (settlement tuples, cached misses) are left as is.
+    """
+    for key, entry in list(cache.items()):
+        if not isinstance(entry, dict):
+            continue
+        coords = entry.get("coords")
+        if key.startswith("page::"):
+            if coords:
+                entry.setdefault("last_edited_time", None)
+            elif entry.get("lat") is not None:
+                cache[key] = {
+                    "coords": {"lat": entry["lat"], "lng": entry.get("lng")},
+                    "last_edited_time": None,
+                }
+            else:
+                del cache[key]
+        elif coords:
+            cache[key] = {"lat": coords.get("lat"), "lng": coords.get("lng")}
+    return cache
+
+
+def _dumps_line(entry) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(entry) + b"\n"
+    return (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _replay_journal(journal: str, cache: dict) -> None:
+    """Apply the journal's JSON lines to `cache`, in order.
+
+    A line is either a one-entry object to set or ``["del", key]`` for a
+    removed key. A torn last line (crash mid-append) is skipped.
+    """
+    if not os.path.exists(journal):
+        return
+    try:
+        with open(journal, "rb") as fh:
+            for line in fh:
+                try:
+                    entry = orjson.loads(line) if orjson is not None else json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict):
+                    cache.update(entry)
+                elif isinstance(entry, list) and len(entry) == 2 and entry[0] == "del":
+                    cache.pop(entry[1], None)
+    except (PermissionError, IOError, OSError):
+        print("⚠ Warning: Could not read geocode cache journal.")
+
+
+def _geocode_journal_path() -> str:
+    # Append-only sidecar of entries flushed since the last full save. It
+    # holds client addresses, so it lives next to this module rather than in
+    # public/, which Flask serves as static files.
+    return os.path.join(os.path.dirname(__file__), "geocode_cache.jsonl")
+
+
 def _geocode_cache_path() -> str:
     public_dir = os.path.join(os.path.dirname(__file__), "public")
     if not os.path.exists(public_dir):
@@ -373,14 +373,26 @@ def generate_js_output(clients: list) -> str:
     lines.append("")
     lines.append("")
 
-    # Add the rest of the file (icons and functions)
-    lines.append("const icons = {")
+    # Add the rest of the file (icons and functions). The icon shapes are
+    # injected once as an SVG sprite; popups only reference them via <use>.
+    lines.append("document.body.insertAdjacentHTML('beforeend',")
+    lines.append(
+        "  '<svg xmlns=\"http://www.w3.org/2000/svg\" aria-hidden=\"true\" style=\"position:absolute;width:0;height:0;overflow:hidden\">' +"
+    )
+    lines.append(
+        '  \'<symbol id="ico-address" viewBox="0 0 24 24"><path d="M21 10c0 7-9 13-9 13s-9-6-9-13a9 9 0 0118 0z"/><circle cx="12" cy="10" r="3"/></symbol>\' +'
+    )
     lines.append(
-        '  address: \'<svg class="popup-icon" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M21 10c0 7-9 13-9 13s-9-6-9-13a9 9 0 0118 0z"/><circle cx="12" cy="10" r="3"/></svg>\','
+        '  \'<symbol id="ico-contact" viewBox="0 0 24 24"><path d="M20 21v-2a4 4 0 00-4-4H8a4 4 0 00-4 4v2"/><circle cx="12" cy="7" r="4"/></symbol>\' +'
     )
+    lines.append("  '</svg>');")
+    lines.append("")
     lines.append(
-        '  contact: \'<svg class="popup-icon" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M20 21v-2a4 4 0 00-4-4H8a4 4 0 00-4 4v2"/><circle cx="12" cy="7" r="4"/></svg>\''
+        "const iconRef = id => '<svg class=\"popup-icon\" viewBox=\"0 0 24 24\" fill=\"none\" stroke=\"currentColor\" stroke-width=\"2\"><use href=\"#' + id + '\"/></svg>';"
     )
+    lines.append("const icons = {")
+    lines.append("  address: iconRef('ico-address'),")
+    lines.append("  contact: iconRef('ico-contact')")
     lines.append("};")
     lines.append("")
     lines.append("function buildPopupHTML(c) {")
@@ -406,11 +418,12 @@ def generate_js_output(clients: list) -> str:
     lines.append("  return html;")
     lines.append("}")
     lines.append("")
+    lines.append(
+        "const HTML_ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '\"': '&quot;', \"'\": '&#39;' };"
+    )
     lines.append("function escapeHtml(text) {")
     lines.append("  if (!text) return '';")
-    lines.append("  const div = document.createElement('div');")
-    lines.append("  div.textContent = text;")
-    lines.append("  return div.innerHTML;")
+    lines.append("  return String(text).replace(/[&<>\"']/g, ch => HTML_ESCAPES[ch]);")
     lines.append("}")
     lines.append("")
     lines.append("const map = new maplibregl.Map({")
@@ -437,21 +450,45 @@ def generate_js_output(clients: list) -> str:
     lines.append("  clients.forEach(c => bounds.extend([c.lng, c.lat]));")
     lines.append("  map.fitBounds(bounds, { padding: 50, maxZoom: 12 });")
     lines.append("")
-    lines.append("  clients.forEach(c => {")
-    lines.append("    const el = document.createElement('div');")
-    lines.append("    el.className = 'marker';")
-    lines.append("    el.style.backgroundColor = c.color || '#ef4444';")
-    lines.append("")
-    lines.append(
-        "    const popup = new maplibregl.Popup({ offset: 15, maxWidth: '320px' })"
-    )
-    lines.append("      .setHTML(buildPopupHTML(c));")
+    # One GeoJSON source drawn by a circle layer instead of a DOM marker per
+    # client; features only carry the client index and color, and the popup
+    # is built from `clients` when a point is clicked
+    lines.append("  map.addSource('clients', {")
+    lines.append("    type: 'geojson',")
+    lines.append("    data: {")
+    lines.append("      type: 'FeatureCollection',")
+    lines.append("      features: clients.map((c, i) => ({")
+    lines.append("        type: 'Feature',")
+    lines.append("        geometry: { type: 'Point', coordinates: [c.lng, c.lat] },")
+    lines.append("        properties: { i, color: c.color || '#ef4444' }")
+    lines.append("      }))")
+    lines.append("    }")
+    lines.append("  });")
+    lines.append("  map.addLayer({")
+    lines.append("    id: 'clients-layer',")
+    lines.append("    type: 'circle',")
+    lines.append("    source: 'clients',")
+    lines.append("    paint: {")
+    lines.append("      'circle-color': ['get', 'color'],")
+    lines.append("      'circle-radius': 7,")
+    lines.append("      'circle-stroke-color': '#fff',")
+    lines.append("      'circle-stroke-width': 2")
+    lines.append("    }")
+    lines.append("  });")
     lines.append("")
-    lines.append("    new maplibregl.Marker({ element: el })")
-    lines.append("      .setLngLat([c.lng, c.lat])")
-    lines.append("      .setPopup(popup)")
+    lines.append("  map.on('click', 'clients-layer', e => {")
+    lines.append("    const f = e.features[0];")
+    lines.append("    new maplibregl.Popup({ offset: 15, maxWidth: '320px' })")
+    lines.append("      .setLngLat(f.geometry.coordinates)")
+    lines.append("      .setHTML(buildPopupHTML(clients[f.properties.i]))")
     lines.append("      .addTo(map);")
     lines.append("  });")
+    lines.append("  map.on('mouseenter', 'clients-layer', () => {")
+    lines.append("    map.getCanvas().style.cursor = 'pointer';")
+    lines.append("  });")
+    lines.append("  map.on('mouseleave', 'clients-layer', () => {")
+    lines.append("    map.getCanvas().style.cursor = '';")
+    lines.append("  });")
     lines.append("});")
 
     return "\n".join(lines)
@@ -4,26 +4,38 @@ Widget Generator Tool - Flask Application
 This Flask application generates embeddable map widgets from Notion databases.
 """
 
+import gzip
 import hashlib
 import json
 import os
-import re
+import threading
 import time
+import uuid
 import asyncio
-import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import xxhash
+except ImportError:  # optional: faster payload fingerprints when installed
+    xxhash = None
+
 from flask import (
     Flask,
     jsonify,
     redirect,
-    render_template_string,
     request,
+    Response,
     url_for,
 )
 
 # Import templates and utilities
-from templates import GENERATOR_HTML, INLINE_MAP_TEMPLATE
-from utils import merge_clients
-from notion_utils import fetch_clients_from_notion, stream_clients_from_notion
+from templates import GENERATOR_HTML, render_widget
+from utils import json_dumps, json_loads, located_clients, merge_clients
+from notion_utils import (
+    fetch_clients_cached,
+    stream_clients_from_notion,
+)
 
 # Initialize Flask app
 STATIC_DIR = os.path.join(os.path.dirname(__file__), "public")
@@ -51,20 +63,41 @@ def request_entity_too_large(error: Exception):  # type: ignore needed for app.e
     )
 
 
+# GENERATOR_HTML has no Jinja markup and never changes at runtime, so encode,
+# gzip and hash it once instead of rendering it on every request.
+_GENERATOR_HTML_BYTES = GENERATOR_HTML.encode("utf-8")
+_GENERATOR_PAGE = (
+    _GENERATOR_HTML_BYTES,
+    gzip.compress(_GENERATOR_HTML_BYTES, compresslevel=9, mtime=0),
+    hashlib.sha1(_GENERATOR_HTML_BYTES).hexdigest(),
+)
+
+
 @app.route("/")
 def index():
     """Serve the main widget generator interface."""
-    return render_template_string(GENERATOR_HTML)
+    html, gz, etag = _GENERATOR_PAGE
+    return _html_response(html, gz, etag, "no-cache")
 
 
 @app.route("/api/generate-widget", methods=["POST"])
 def generate_widget():
     """API endpoint to generate a widget from Notion data.
 
-    Now stores the widget on the server and returns just the widget ID and preview URL.
-    This avoids the client having to POST large HTML payloads back to the server.
+    Fetching and geocoding can take minutes for large databases, so the work
+    runs in a background job. Returns a job ID immediately; poll
+    `/generate/status/<job_id>` for the widget ID and preview URL.
     """
-    data = request.get_json()
+    # The body is a small JSON object: decode the raw bytes directly rather
+    # than going through request.get_json() and its content-type checks.
+    # An empty body falls through to the env var defaults below.
+    raw = request.get_data(cache=False)
+    try:
+        data = json_loads(raw) if raw.strip() else {}
+    except ValueError:
+        return jsonify({"error": "Request body must be valid JSON"}), 400
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
     # Support both camelCase and snake_case
     api_key = data.get("api_key") or data.get("apiKey")
     database_id = data.get("database_id") or data.get("databaseId")
@@ -85,101 +118,97 @@ def generate_widget():
             400,
         )
 
-    notion_clients = []
+    job_id = _submit_job(_build_widget, api_key, database_id)
+    return (
+        jsonify(
+            {
+                "job_id": job_id,
+                "status_url": url_for("generate_status", job_id=job_id),
+            }
+        ),
+        202,
+    )
 
-    try:
-        # Allow caller to opt-out of geocoding to speed up responses (default: False)
-        geocode_flag = data.get("geocode")
-        if geocode_flag is None:
-            # support camelCase
-            geocode_flag = (
-                data.get("geocode")
-                or data.get("doGeocode")
-                or data.get("geocodeEnabled")
-            )
-        geocode_flag = bool(geocode_flag)
-
-        if api_key and database_id:
-            # fetch_clients_from_notion is async, run in event loop
-            notion_clients = asyncio.run(
-                fetch_clients_from_notion(api_key, database_id)
-            )
-
-        # Use Notion clients only; dedupe within the set if necessary.
-        clients = merge_clients([], notion_clients, dedupe=True)
-
-        pre_filter_count = len(clients)
-        # Filter out clients without valid coordinates to prevent map rendering errors
-        clients = [
-            c for c in clients if c.get("lat") is not None and c.get("lng") is not None
-        ]
-        post_filter_count = len(clients)
-
-        if pre_filter_count != post_filter_count:
-            print(
-                f"⚠️  Final Filter: Dropped {pre_filter_count - post_filter_count} clients due to missing coordinates"
-            )
-            print(
-                f"   (These clients had addresses but geocoding failed or returned no results)"
-            )
-
-        # Prevent basic script injection by escaping tags
-        clients_json = (
-            json.dumps(clients).replace("<", "\\u003c").replace(">", "\\u003e")
-        )
 
-        # Prefer using the `public/widget.html` file as the authoritative template.
-        # Read the file and replace the `const clients = [...]` declaration with actual data.
-        template_path = os.path.join(os.path.dirname(__file__), "public", "widget.html")
-        try:
-            with open(template_path, "r", encoding="utf-8") as fh:
-                tpl = fh.read()
-
-            # Replace any existing clients declaration with our JSON array.
-            # This looks for: const clients = [ ... ]; (multiline)
-            tpl = re.sub(
-                r"const\s+clients\s*=\s*\[.*?\];",
-                lambda _m: f"const clients = {clients_json};",
-                tpl,
-                flags=re.S,
-            )
-
-            widget_html = tpl
-        except FileNotFoundError:
-            # Fall back to the inline template if the file isn't available
-            widget_html = INLINE_MAP_TEMPLATE.format(clients_json=clients_json)
-
-        # Store widget immediately on the server to avoid large payloads
-        wid = _store_widget(widget_html)
+@app.route("/generate/status/<job_id>", methods=["GET"])
+def generate_status(job_id: str):
+    """Report the state of a widget generation job."""
+    future = _get_job(job_id)
+    if future is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    if not future.done():
+        return jsonify({"state": "pending"})
 
-        # Inject widget ID as a data attribute for robust client-side detection
-        widget_html = widget_html.replace(
-            '<div id="map"', f'<div id="map" data-widget-id="{wid}"'
-        )
+    exc = future.exception()
+    if exc is not None:
+        return jsonify({"state": "error", "error": str(exc)}), 500
 
-        html_size_mb = len(widget_html.encode("utf-8")) / (1024 * 1024)
+    result = dict(future.result())
+    result["state"] = "done"
+    result["preview_url"] = url_for(
+        "view_widget_id", wid=result["widget_id"], _external=True
+    )
+    return jsonify(result)
+
+
+def _build_widget(api_key: str, database_id: str) -> dict:
+    """Fetch clients from Notion, render the widget and store it.
+
+    Runs on the background executor. Returns the widget ID, client count
+    and HTML size.
+    """
+    # fetch_clients_cached is async, run in event loop; reuses a recent
+    # on-disk copy of the clients (see NOTION_CACHE_TTL)
+    notion_clients = asyncio.run(fetch_clients_cached(api_key, database_id))
+
+    # Use Notion clients only; dedupe within the set if necessary.
+    clients = merge_clients([], notion_clients, dedupe=True)
+
+    pre_filter_count = len(clients)
+    # Filter out clients without valid coordinates to prevent map rendering errors
+    clients, bounds = located_clients(clients)
+    post_filter_count = len(clients)
+
+    if pre_filter_count != post_filter_count:
+        print(
+            f"⚠️  Final Filter: Dropped {pre_filter_count - post_filter_count} clients due to missing coordinates"
+        )
         print(
-            f"[INFO] Generated widget HTML: {html_size_mb:.2f} MB for {len(clients)} clients"
+            f"   (These clients had addresses but geocoding failed or returned no results)"
         )
 
-        preview_url = url_for("view_widget_id", wid=wid, _external=True)
+    # Same data produces the same page: reuse the stored widget instead of
+    # rendering and hashing it again.
+    build_key = (database_id, _fingerprint(json_dumps(clients)))
+    with _WIDGET_STORE_LOCK:
+        cached = _WIDGET_BUILDS.get(build_key)
+    if cached is not None and _get_widget(cached["widget_id"]) is not None:
+        print(f"[INFO] Notion data unchanged, reusing widget {cached['widget_id']}")
+        return dict(cached)
 
-        return jsonify(
-            {
-                "widget_id": wid,
-                "preview_url": preview_url,
-                "clients": len(clients),
-                "size_mb": round(html_size_mb, 2),
-            }
-        )
-    except (
-        requests.RequestException,
-        KeyError,
-        ValueError,
-        AttributeError,
-        TypeError,
-    ) as e:
-        return jsonify({"error": str(e)}), 500
+    # public/widget.html is output of regenerate_widget.py, not a template:
+    # always render from the inline template so the payload is consistent
+    widget_html = render_widget(clients, bounds=bounds)
+
+    # Store widget immediately on the server to avoid large payloads
+    wid = _store_widget(widget_html)
+
+    html_size_mb = len(widget_html.encode("utf-8")) / (1024 * 1024)
+    print(
+        f"[INFO] Generated widget HTML: {html_size_mb:.2f} MB for {len(clients)} clients"
+    )
+
+    result = {
+        "widget_id": wid,
+        "clients": len(clients),
+        "size_mb": round(html_size_mb, 2),
+    }
+    with _WIDGET_STORE_LOCK:
+        # Skip widgets already evicted again so no entry outlives its widget
+        if wid in _WIDGET_STORE:
+            _WIDGET_BUILDS[build_key] = result
+            _WIDGET_BUILD_KEYS.setdefault(wid, set()).add(build_key)
+    return dict(result)
 
 
 @app.route("/api/upload-csv", methods=["POST"])
@@ -206,6 +235,44 @@ def generate():
     return generate_widget()
 
 
+@app.route("/widget", methods=["GET"])
+def serve_widget():
+    """Serve `public/widget.html` with an ETag and a precompressed gzip body.
+
+    The file is read and compressed once per change (tracked by mtime), so
+    polling embeds only cost a stat and usually get a 304.
+    """
+    try:
+        html, gz, etag = _load_widget_file()
+    except FileNotFoundError:
+        return "widget.html has not been generated yet", 404
+
+    return _html_response(html, gz, etag, "no-cache")
+
+
+def _html_response(html: bytes, gz: bytes, etag: str, cache_control: str):
+    """Answer with 304 on a matching If-None-Match, else gzip or plain HTML.
+
+    The gzip body is a different representation, so it gets its own strong
+    ETag (`<etag>-gz`).
+    """
+    use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+    tag = f"{etag}-gz" if use_gzip else etag
+    # If-None-Match is a comma-separated list that may carry W/ prefixes or
+    # "*"; werkzeug parses it and contains_weak does the RFC 9110 comparison
+    if request.if_none_match.contains_weak(tag):
+        resp = Response(status=304)
+    elif use_gzip:
+        resp = Response(gz, mimetype="text/html")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response(html, mimetype="text/html")
+    resp.headers["ETag"] = f'"{tag}"'
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.headers["Cache-Control"] = cache_control
+    return resp
+
+
 @app.route("/view-widget", methods=["GET", "POST"])
 def view_widget():
     """Serve the generated widget. Accepts `html` via GET query or POST form.
@@ -233,16 +300,16 @@ def view_widget():
 
 @app.route("/view-widget/<wid>", methods=["GET"])
 def view_widget_id(wid: str):
-    """Render stored widget by id. Returns 404 if expired or not found."""
-    widget_html = _get_widget(wid)
-    if not widget_html:
+    """Render stored widget by id. Returns 404 if expired or not found.
+
+    A stored widget never changes, so its page is encoded, gzipped and
+    hashed once and then served from memory (or as a 304).
+    """
+    page = _get_widget_page(wid)
+    if page is None:
         return "Widget not found or expired", 404
-    # Inject widget ID as a data attribute for robust client-side detection
-    # This ensures the ID is available even if the URL changes or wid is not in params
-    widget_html = widget_html.replace(
-        '<div id="map"', f'<div id="map" data-widget-id="{wid}"'
-    )
-    return render_template_string(widget_html)
+    html, gz, etag = page
+    return _html_response(html, gz, etag, f"public, max-age={_WIDGET_TTL}")
 
 
 @app.route("/api/notion-clients/stream", methods=["GET"])
@@ -269,7 +336,7 @@ def stream_notion_clients():
         try:
             for batch in stream_clients_from_notion(api_key, database_id, batch_size=25):
                 total += len(batch)
-                payload = json.dumps(batch, ensure_ascii=False)
+                payload = json_dumps(batch)
                 yield f"event: batch\ndata: {payload}\n\n"
             yield f"event: done\ndata: {{\"total\": {total}}}\n\n"
         except GeneratorExit:
@@ -287,42 +354,168 @@ def stream_notion_clients():
 
 @app.route("/api/widget/<wid>", methods=["GET"])
 def get_widget_html(wid: str):
-    """Get raw widget HTML by ID for embedding. Returns JSON with HTML content."""
+    """Get raw widget HTML by ID for embedding.
+
+    The HTML is sent as-is (text/html) rather than wrapped in JSON, so the
+    multi-MB page is never copied into an escaped JSON string. A stored
+    widget never changes, so its ID doubles as the ETag.
+    """
+    widget_html = _get_widget(wid)
+    if not widget_html:
+        return jsonify({"error": "Widget not found or expired"}), 404
+
+    if request.if_none_match.contains_weak(wid):
+        resp = Response(status=304)
+    else:
+        resp = Response(widget_html, mimetype="text/html")
+    resp.headers["ETag"] = f'"{wid}"'
+    resp.headers["Cache-Control"] = f"private, max-age={_WIDGET_TTL}"
+    return resp
+
+
+@app.route("/api/widget/<wid>/meta", methods=["GET"])
+def get_widget_meta(wid: str):
+    """Get the size of a stored widget without transferring its HTML."""
     widget_html = _get_widget(wid)
     if not widget_html:
         return jsonify({"error": "Widget not found or expired"}), 404
 
     html_size_mb = len(widget_html.encode("utf-8")) / (1024 * 1024)
-    return jsonify(
-        {"widget_id": wid, "html": widget_html, "size_mb": round(html_size_mb, 2)}
-    )
+    return jsonify({"widget_id": wid, "size_mb": round(html_size_mb, 2)})
+
+
+# Background widget generation jobs. Keys are short hex ids; values are
+# tuples (future, expiry_timestamp).
+_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+_JOBS: dict = {}
+_JOB_TTL = 60 * 60  # 1 hour
+
+
+def _submit_job(fn, *args) -> str:
+    now = time.time()
+    for jid, (_, expiry) in list(_JOBS.items()):
+        if now > expiry:
+            _JOBS.pop(jid, None)
+    job_id = uuid.uuid4().hex[:12]
+    _JOBS[job_id] = (_EXECUTOR.submit(fn, *args), now + _JOB_TTL)
+    return job_id
+
+
+def _get_job(job_id: str):
+    entry = _JOBS.get(job_id)
+    if not entry:
+        return None
+    return entry[0]
+
+
+# In-memory copy of public/widget.html: (mtime, raw bytes, gzip bytes, etag).
+_WIDGET_FILE = os.path.join(STATIC_DIR, "widget.html")
+_WIDGET_FILE_CACHE: tuple = (None, b"", b"", "")
+
+
+def _load_widget_file() -> tuple:
+    global _WIDGET_FILE_CACHE
+    mtime = os.stat(_WIDGET_FILE).st_mtime_ns
+    if _WIDGET_FILE_CACHE[0] != mtime:
+        with open(_WIDGET_FILE, "rb") as fh:
+            html = fh.read()
+        gz = gzip.compress(html, compresslevel=6, mtime=0)
+        etag = hashlib.sha1(html).hexdigest()
+        _WIDGET_FILE_CACHE = (mtime, html, gz, etag)
+    return _WIDGET_FILE_CACHE[1:]
 
 
 # Simple in-memory temporary store for large widget HTML payloads.
-# Keys are short hex ids; values are tuples (html, expiry_timestamp).
-_WIDGET_STORE = {}
+# Keys are short hex ids; values are tuples (html, expiry_timestamp, size).
+# Entries are kept in least-recently-used order and evicted once expired or
+# when the stored HTML exceeds _WIDGET_STORE_MAX_BYTES in total.
+_WIDGET_STORE: "OrderedDict[str, tuple]" = OrderedDict()
 _WIDGET_TTL = 60 * 60 * 24  # 24 hours (widgets now stored server-side)
+_WIDGET_STORE_MAX_BYTES = int(os.environ.get("WIDGET_STORE_MAX_MB", "256")) << 20
+_WIDGET_STORE_BYTES = 0
+_WIDGET_STORE_LOCK = threading.Lock()
 
 
-def _store_widget(html: str) -> str:
+# Finished builds: (database_id, payload fingerprint) -> _build_widget result,
+# plus widget id -> its build keys so evicting a widget drops them as well.
+# Both are guarded by _WIDGET_STORE_LOCK.
+_WIDGET_BUILDS: dict = {}
+_WIDGET_BUILD_KEYS: dict = {}
+
 
-    ts = str(time.time()).encode("utf-8")
-    # Use a short hash to create compact ids
-    wid = hashlib.sha1(ts + html.encode("utf-8")).hexdigest()[:12]
-    expiry = time.time() + _WIDGET_TTL
-    _WIDGET_STORE[wid] = (html, expiry)
+def _fingerprint(text: str) -> str:
+    """Return a short hash of `text` (xxh3 when installed, else blake2b)."""
+    data = text.encode("utf-8")
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(data)
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def _drop_widget(wid: str) -> None:
+    """Remove a stored widget and its served form. Caller holds the lock."""
+    global _WIDGET_STORE_BYTES
+    entry = _WIDGET_STORE.pop(wid, None)
+    if entry is not None:
+        _WIDGET_STORE_BYTES -= entry[2]
+    _WIDGET_PAGES.pop(wid, None)
+    for key in _WIDGET_BUILD_KEYS.pop(wid, ()):
+        _WIDGET_BUILDS.pop(key, None)
+
+
+def _store_widget(html: str) -> str:
+    global _WIDGET_STORE_BYTES
+    data = html.encode("utf-8")
+    # Ids are content hashes, so storing the same widget again (e.g. after
+    # regenerating an unchanged database) reuses the existing entry
+    wid = hashlib.sha1(data).hexdigest()[:12]
+    now = time.time()
+    with _WIDGET_STORE_LOCK:
+        _drop_widget(wid)
+        _WIDGET_STORE[wid] = (html, now + _WIDGET_TTL, len(data))
+        _WIDGET_STORE_BYTES += len(data)
+        # Oldest entries first: drop expired ones, then least recently used
+        # ones until the store fits its budget (never the one just stored)
+        for old_wid, (_, expiry, _) in list(_WIDGET_STORE.items()):
+            if old_wid == wid:
+                break
+            if now > expiry or _WIDGET_STORE_BYTES > _WIDGET_STORE_MAX_BYTES:
+                _drop_widget(old_wid)
     return wid
 
 
 def _get_widget(wid: str):
-    entry = _WIDGET_STORE.get(wid)
-    if not entry:
-        return None
-    html, expiry = entry
-    if time.time() > expiry:
-        try:
-            del _WIDGET_STORE[wid]
-        except KeyError:
-            print("An error occurred while deleting _WIDGET_STORE[wid].")
-        return None
+    with _WIDGET_STORE_LOCK:
+        entry = _WIDGET_STORE.get(wid)
+        if not entry:
+            return None
+        html, expiry, _ = entry
+        if time.time() > expiry:
+            _drop_widget(wid)
+            return None
+        _WIDGET_STORE.move_to_end(wid)
     return html
+
+
+# Served form of stored widgets: wid -> (html bytes, gzip bytes, etag).
+# Built on first view; dropped together with the _WIDGET_STORE entry.
+_WIDGET_PAGES: dict = {}
+
+
+def _get_widget_page(wid: str):
+    widget_html = _get_widget(wid)
+    if not widget_html:
+        return None
+    page = _WIDGET_PAGES.get(wid)
+    if page is None:
+        # Inject widget ID as a data attribute for robust client-side detection
+        # This ensures the ID is available even if the URL changes or wid is not in params
+        html = widget_html.replace(
+            '<div id="map"', f'<div id="map" data-widget-id="{wid}"'
+        ).encode("utf-8")
+        gz = gzip.compress(html, compresslevel=6, mtime=0)
+        page = (html, gz, hashlib.sha1(html).hexdigest())
+        with _WIDGET_STORE_LOCK:
+            # Skip caching if the widget was evicted meanwhile
+            if wid in _WIDGET_STORE:
+                _WIDGET_PAGES[wid] = page
+    return page
@@ -1,20 +1,288 @@
 """Utilities for fetching and processing Notion data."""
 
 import asyncio
+import hashlib
+import os
+import re
+import sys
+import tempfile
 import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
 import json  # added import
 
-import requests
+import aiohttp
+import numpy as np
 from utils import (
     _GEOCODE_CACHE_LOCK,
-    _geocode_cache_key,
+    _cached_address,
     _geocode_cache_manager,
     _load_geocode_cache,
+    _norm_place,
+    _notion_source_filter,
     _save_geocode_cache,
     batch_geocode,
-    fetch_notion_data,
+    iter_notion_pages,
+    json_dumps,
+    json_loads,
 )
 
+# Notion label colors mapped to marker hex colors. Values are interned so every
+# client dict shares the same string objects.
+_NOTION_COLOR_MAP = {
+    k: sys.intern(v)
+    for k, v in {
+        "gray": "#6b7280",
+        "brown": "#92400e",
+        "orange": "#ea580c",
+        "yellow": "#eab308",
+        "green": "#16a34a",
+        "blue": "#2563eb",
+        "purple": "#9333ea",
+        "pink": "#db2777",
+        "red": "#ef4444",
+        "default": "#6b7280",
+    }.items()
+}
+_DEFAULT_LABEL_COLOR = _NOTION_COLOR_MAP["red"]
+
+# A place that is literally "lat, lng" needs no geocoding.
+_LATLNG_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+
+# A page waiting on geocoding, grouped under its normalized place.
+_PendingPage = namedtuple("_PendingPage", "client page_id edited name")
+
+# Free-text address properties, tried in order.
+_ADDRESS_CANDIDATE_KEYS = ("АДРЕСА", "Адреса", "Address 1 - Formatted")
+# Structured address parts joined when no free-text address is present.
+_ADDRESS_COMPONENT_KEYS = (
+    "Address 1 - Street",
+    "Address 1 - City",
+    "Address 1 - Region",
+    "Address 1 - Country",
+)
+
+# Properties read when building a client; the Notion query returns only these.
+_CLIENT_PROPERTIES = (
+    "Name",
+    "name",
+    "Place",
+    "place",
+    *_ADDRESS_CANDIDATE_KEYS,
+    *_ADDRESS_COMPONENT_KEYS,
+    "Labels",
+    "Label",
+    "ТЕЛЕФОН",
+    "Phone",
+    "ЕЛ.АДРЕСА",
+    "Email",
+    "E-mail 1 - Value",
+    "КОНТАКТ",
+    "ПРИМІТКА",
+    "Notes",
+    "Organization Title",
+)
+
+
+def _extract_clients(pages):
+    extracted = [_extract_client_from_page(page, check_latlng=False) for page in pages]
+    _resolve_latlng_places(extracted)
+    return extracted
+
+
+def _resolve_latlng_places(extracted):
+    """Resolve places that are literal "lat, lng" strings for a whole batch.
+
+    Matches are range-checked together with NumPy; valid entries are
+    rewritten in place to the (client_data, None, None, None) form.
+    """
+    cands = []
+    for i, item in enumerate(extracted):
+        if item is not None and item[1] is not None:
+            m = _LATLNG_RE.match(item[1])
+            if m:
+                cands.append((i, m))
+    if not cands:
+        return
+
+    lats = np.array([m.group(1) for _, m in cands]).astype(np.float64)
+    lngs = np.array([m.group(2) for _, m in cands]).astype(np.float64)
+    valid = (np.abs(lats) <= 90) & (np.abs(lngs) <= 180)
+    for (i, _), ok, lat, lng in zip(cands, valid.tolist(), lats.tolist(), lngs.tolist()):
+        if ok:
+            client_data = extracted[i][0]
+            client_data["lat"] = lat
+            client_data["lng"] = lng
+            extracted[i] = (client_data, None, None, None)
+
+
+# Filtered pages are kept on disk between runs so later runs only ask Notion
+# for pages edited since the previous sync. Pages that are deleted or leave
+# the filter never show up in such a delta, so each sync also lists the ids
+# still matching the filter (projected to the title only) and drops the rest.
+# The snapshot is rebuilt from a full query once it is older than
+# NOTION_FULL_SYNC_TTL seconds.
+_NOTION_FULL_SYNC_TTL = 86400
+# Cheapest projection for the id-only pass; unknown names are skipped.
+_NOTION_ID_PROPERTIES = ("Name", "name")
+
+
+def _notion_pages_path(database_id: str) -> str:
+    digest = hashlib.sha1(database_id.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"notion_pages_{digest}.json")
+
+
+def _load_notion_pages(path: str, query_key: str):
+    """Return the page snapshot at `path`, or None when it cannot be reused."""
+    try:
+        ttl = float(os.environ.get("NOTION_FULL_SYNC_TTL", _NOTION_FULL_SYNC_TTL))
+    except ValueError:
+        ttl = _NOTION_FULL_SYNC_TTL
+    try:
+        with open(path, "rb") as fh:
+            snapshot = json_loads(fh.read())
+        if snapshot["query"] != query_key or time.time() - snapshot["full_at"] >= ttl:
+            return None
+        datetime.fromisoformat(snapshot["synced_at"])
+        if not isinstance(snapshot["pages"], dict):
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return snapshot
+
+
+def _write_json_atomic(path: str, value) -> None:
+    """Write `value` as JSON to a unique temp file, then rename it to `path`.
+
+    Readers never see a partial file, and concurrent writers in one process
+    (executor workers, the SSE thread) never share a temp file.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=os.path.basename(path), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(json_dumps(value))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _save_notion_pages(path: str, snapshot: dict) -> None:
+    try:
+        _write_json_atomic(path, snapshot)
+    except (OSError, TypeError, ValueError):
+        print("⚠ Warning: Could not write Notion pages snapshot.")
+
+
+def _snapshot_page(page: dict) -> dict:
+    """Keep only the page fields `_extract_client_from_page` reads."""
+    return {
+        "id": page.get("id"),
+        "last_edited_time": page.get("last_edited_time"),
+        "properties": page.get("properties", {}),
+    }
+
+
+async def _iter_synced_pages(api_key, database_id):
+    """Yield the filtered database's pages in batches of up to 100.
+
+    Without a usable snapshot this streams a full query and records it. With
+    one, only pages edited since the last sync are queried and merged over
+    the snapshot; an id-only query of the filter then drops pages that were
+    deleted, archived or no longer match, and the rest is yielded. Notion
+    stores last_edited_time to the minute, so the delta starts a minute
+    before the previous sync began to allow for clock skew.
+    """
+    filter_ = _notion_source_filter()
+    query_key = json.dumps([filter_, _CLIENT_PROPERTIES], sort_keys=True)
+    path = _notion_pages_path(database_id)
+    started = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+
+    snapshot = await asyncio.to_thread(_load_notion_pages, path, query_key)
+    if snapshot is None:
+        full_at = time.time()
+        pages = {}
+        async for results in iter_notion_pages(
+            api_key,
+            database_id,
+            filter_=filter_,
+            filter_properties=_CLIENT_PROPERTIES,
+        ):
+            for page in results:
+                pages[page.get("id")] = _snapshot_page(page)
+            yield results
+    else:
+        full_at = snapshot["full_at"]
+        pages = snapshot["pages"]
+        since = datetime.fromisoformat(snapshot["synced_at"])
+        delta_filter = {
+            "and": [
+                filter_,
+                {
+                    "timestamp": "last_edited_time",
+                    "last_edited_time": {"on_or_after": since.isoformat()},
+                },
+            ]
+        }
+        changed = 0
+        async for results in iter_notion_pages(
+            api_key,
+            database_id,
+            filter_=delta_filter,
+            filter_properties=_CLIENT_PROPERTIES,
+        ):
+            changed += len(results)
+            for page in results:
+                pages[page.get("id")] = _snapshot_page(page)
+        live_ids = set()
+        async for results in iter_notion_pages(
+            api_key,
+            database_id,
+            filter_=filter_,
+            filter_properties=_NOTION_ID_PROPERTIES,
+        ):
+            live_ids.update(page.get("id") for page in results)
+        stale = pages.keys() - live_ids
+        for page_id in stale:
+            del pages[page_id]
+        print(
+            f"Notion delta sync: {changed} pages edited since "
+            f"{since:%Y-%m-%d %H:%M} UTC, {len(stale)} removed"
+        )
+        merged = list(pages.values())
+        for i in range(0, len(merged), 100):
+            yield merged[i : i + 100]
+
+    await asyncio.to_thread(
+        _save_notion_pages,
+        path,
+        {
+            "query": query_key,
+            "full_at": full_at,
+            "synced_at": (started - timedelta(minutes=1)).isoformat(),
+            "pages": pages,
+        },
+    )
+
+
+async def _iter_client_pages(api_key, database_id):
+    """Yield (page, extracted) pairs as Notion query results arrive.
+
+    `extracted` is the `_extract_client_from_page` result. Each batch of
+    pages is parsed on a worker thread so the event loop keeps reading the
+    prefetched next response meanwhile. Pages come from
+    `_iter_synced_pages`, so repeat runs only fetch what changed.
+    """
+    async for results in _iter_synced_pages(api_key, database_id):
+        parsed = await asyncio.to_thread(_extract_clients, results)
+        for page, extracted in zip(results, parsed):
+            yield page, extracted
+
 
 async def fetch_clients_from_notion(api_key, database_id):
     """Fetch client location data from Notion database.
@@ -25,305 +293,102 @@ async def fetch_clients_from_notion(api_key, database_id):
     entries_processed = 0
     entries_with_place = 0
     entries_geocoded = 0
-    dropped_source_mismatch = 0
     dropped_no_address = 0
     failed_geocodes = []
 
     try:
         print("Fetching data from Notion...")
-        notion_data = await fetch_notion_data(api_key, database_id)
-        total_entries = len(notion_data.get("results", []))
-        print(f"Found {total_entries} total entries in database")
+
+        # Read the geocode cache from disk on a worker thread while the
+        # Notion pages stream in; it is needed once the last page arrives
+        cache_load = asyncio.create_task(asyncio.to_thread(_load_geocode_cache))
 
         # Collect pages needing geocoding to batch later
         pending_pages: list[tuple[dict, str, str, str, str]] = (
             []
         )  # (client_data, place, name, page_id, page_edited)
+        # Bound once; the page count is not known up front since pages stream in
+        clients_append = clients.append
+        pending_append = pending_pages.append
 
-        for page in notion_data.get("results", []):
-            entries_processed += 1
-            # Print lightweight progress every 50 pages to avoid flooding
-            if entries_processed % 50 == 0:
-                print(
-                    f"Processing Notion pages: {entries_processed}/{total_entries}",
-                    end="\r",
-                    flush=True,
-                )
-            props = page.get("properties", {})
-
-            # Filter: Only include entries where Source = "БАЗА"
-            source_prop = props.get("Source") or props.get("source")
-            source_value = None
-            if source_prop:
-                if source_prop.get("type") == "select" and source_prop.get("select"):
-                    source_value = source_prop["select"].get("name", "")
-                elif source_prop.get("type") == "rich_text" and source_prop.get(
-                    "rich_text"
-                ):
-                    source_value = (
-                        source_prop["rich_text"][0]["plain_text"]
-                        if source_prop["rich_text"]
-                        else ""
-                    )
-
-            if source_value != "БАЗА":
-                dropped_source_mismatch += 1
-                continue
-
-            # If we reach here, entry has passed the filter
-            # and we can safely extract name
-            name_prop = props.get("Name") or props.get("name")
-            name = "Unnamed"
-            if name_prop and name_prop.get("title"):
-                name = (
-                    name_prop["title"][0]["plain_text"]
-                    if name_prop["title"]
-                    else "Unnamed"
-                )
-
-            # Phone number (Ukrainian field first as БАЗА entries use it)
-            phone = ""
-            phone_prop = props.get("ТЕЛЕФОН") or props.get("Phone")
-            if phone_prop and phone_prop.get("rich_text") and phone_prop["rich_text"]:
-                phone = phone_prop["rich_text"][0]["plain_text"]
-
-            # Email
-            email = ""
-            email_prop = (
-                props.get("ЕЛ.АДРЕСА")
-                or props.get("Email")
-                or props.get("E-mail 1 - Value")
-            )
-            if email_prop:
-                if email_prop.get("type") == "email":
-                    email = email_prop.get("email") or ""
-                elif email_prop.get("type") == "rich_text" and email_prop.get(
-                    "rich_text"
-                ):
-                    email = (
-                        email_prop["rich_text"][0]["plain_text"]
-                        if email_prop["rich_text"]
-                        else ""
-                    )
-
-            # Contact person
-            contact = ""
-            contact_prop = props.get("КОНТАКТ")
-            if (
-                contact_prop
-                and contact_prop.get("rich_text")
-                and contact_prop["rich_text"]
-            ):
-                contact = contact_prop["rich_text"][0]["plain_text"]
-
-            # Notes/Comments (Ukrainian field first as БАЗА entries use it)
-            notes = ""
-            notes_prop = props.get("ПРИМІТКА") or props.get("Notes")
-            if notes_prop and notes_prop.get("rich_text") and notes_prop["rich_text"]:
-                notes = notes_prop["rich_text"][0]["plain_text"]
-                # Truncate long notes
-                if len(notes) > 100:
-                    notes = notes[:100] + "..."
-
-            # Organization title
-            org_title = ""
-            org_title_prop = props.get("Organization Title")
-            if org_title_prop and org_title_prop.get("select"):
-                org_title = org_title_prop["select"].get("name", "")
-
-            # Map Notion colors to hex
-            color_map = {
-                "gray": "#6b7280",
-                "brown": "#92400e",
-                "orange": "#ea580c",
-                "yellow": "#eab308",
-                "green": "#16a34a",
-                "blue": "#2563eb",
-                "purple": "#9333ea",
-                "pink": "#db2777",
-                "red": "#ef4444",
-                "default": "#6b7280",
-            }
-
-            # Extract label color
-            label_color = "#ef4444"  # default red
-            label_name = ""
-            labels_prop = props.get("Labels") or props.get("Label")
-            if labels_prop:
-                if labels_prop.get("type") == "multi_select" and labels_prop.get(
-                    "multi_select"
-                ):
-                    # Get first label's color
-                    first_label = labels_prop["multi_select"][0]
-                    notion_color = first_label.get("color", "red")
-                    label_name = first_label.get("name", "")
-                    label_color = color_map.get(notion_color, "#ef4444")
-
-                elif labels_prop.get("type") == "select" and labels_prop.get("select"):
-                    notion_color = labels_prop["select"].get("color", "red")
-                    label_name = labels_prop["select"].get("name", "")
-                    label_color = color_map.get(notion_color, "#ef4444")
-
-            # Extract place - try multiple sources
-            place = ""
-            address_display = ""  # For showing in popup
-            latlng = None
-
-            # 1. Try iterating through known address fields until we find one with text
-            address_candidates = ["АДРЕСА", "Адреса", "Address 1 - Formatted"]
-            for candidate_key in address_candidates:
-                candidate_prop = props.get(candidate_key)
-                if candidate_prop and candidate_prop.get("rich_text"):
-                    potential_place = (
-                        candidate_prop["rich_text"][0]["plain_text"]
-                        if candidate_prop["rich_text"]
-                        else ""
-                    )
-                    if potential_place and potential_place.strip():
-                        place = potential_place
-                        address_display = place
-                        break  # Found a valid address, stop looking
-
-            # 2. Try the Place property (Notion location type)
-            if not latlng and not place:
-                place_prop = props.get("Place") or props.get("place")
-                if place_prop and place_prop.get("type") == "place":
-                    location_value = place_prop.get("place")
-                    if location_value:
-                        if (
-                            "latitude" in location_value
-                            and "longitude" in location_value
-                        ):
-                            latlng = (
-                                location_value["latitude"],
-                                location_value["longitude"],
-                            )
-                            address_display = location_value.get("name", "")
-                        elif "name" in location_value:
-                            place = location_value["name"]
-                            address_display = place
-
-            # 3. Try Address 1 - Formatted
-            if not latlng and not place:
-                addr_formatted = props.get("Address 1 - Formatted")
-                if addr_formatted and addr_formatted.get("rich_text"):
-                    # Only use if rich_text is not empty
-                    potential_place = (
-                        addr_formatted["rich_text"][0]["plain_text"]
-                        if addr_formatted["rich_text"]
-                        else ""
+        # Pages are parsed as each query response arrives; the next one is
+        # fetched meanwhile.
+        try:
+            async for page, extracted in _iter_client_pages(api_key, database_id):
+                entries_processed += 1
+                # Print lightweight progress every 50 pages to avoid flooding
+                if entries_processed % 50 == 0:
+                    print(
+                        f"Processing Notion pages: {entries_processed}",
+                        end="\r",
+                        flush=True,
                     )
-                    if potential_place and potential_place.strip():
-                        place = potential_place
-                        address_display = place
-
-            # 4. Build from components
-            if not latlng and not place:
-                address_parts = []
-                for key in [
-                    "Address 1 - Street",
-                    "Address 1 - City",
-                    "Address 1 - Region",
-                    "Address 1 - Country",
-                ]:
-                    comp = props.get(key)
-                    if comp and comp.get("rich_text"):
-                        # Only use if rich_text is not empty
-                        txt = (
-                            comp["rich_text"][0]["plain_text"]
-                            if comp["rich_text"]
-                            else ""
+                if extracted is None:
+                    dropped_no_address += 1
+                    # Log the first few dropped addresses to debug
+                    if dropped_no_address <= 5:
+                        props = page.get("properties", {})
+                        name_prop = props.get("Name") or props.get("name") or {}
+                        name = (name_prop.get("title") or [{}])[0].get(
+                            "plain_text", "Unnamed"
                         )
-                        if txt and txt.strip():
-                            address_parts.append(txt)
-                if address_parts:
-                    place = ", ".join(address_parts)
-                    address_display = place
+                        print(
+                            f"DEBUG: Dropped client '{name}' - No address found in properties. Available keys: {list(props.keys())}"
+                        )
+                        # Inspect 'Адреса' or 'АДРЕСА' specifically
+                        addr_debug = props.get("АДРЕСА") or props.get("Адреса")
+                        if addr_debug:
+                            print(
+                                f"DEBUG: Found 'Адреса' property content: {json.dumps(addr_debug, default=str)}"
+                            )
+                        else:
+                            print("DEBUG: 'Адреса' property is missing or None")
+                    continue
 
-            # Build client data object with all properties
-            client_data = {
-                "name": name,
-                "color": label_color,
-                "phone": phone,
-                "email": email,
-                "contact": contact,
-                "address": address_display,
-                "notes": notes,
-                "label": label_name,
-                "orgTitle": org_title,
-            }
-
-            # If we already have coordinates, use them
-            if latlng:
                 entries_with_place += 1
-                entries_geocoded += 1
-                client_data["lat"] = latlng[0]
-                client_data["lng"] = latlng[1]
-                clients.append(client_data)
-            # Otherwise, geocode the place string
-            elif place:
-                entries_with_place += 1
-                # Check if it's already in lat,lng format
-                if "," in place and place.count(",") == 1:
-                    try:
-                        parts = place.split(",")
-                        lat = float(parts[0].strip())
-                        lng = float(parts[1].strip())
-                        if -90 <= lat <= 90 and -180 <= lng <= 180:
-                            entries_geocoded += 1
-                            client_data["lat"] = lat
-                            client_data["lng"] = lng
-                            clients.append(client_data)
-                            continue
-                    except (ValueError, IndexError):
-                        pass
-
-                # Defer geocoding for batch processing, include page id
-                # and edit time for change-detection
-                page_id = page.get("id")
-                page_edited = page.get("last_edited_time") or ""
-                pending_pages.append((client_data, place, name, page_id, page_edited))
-            else:
-                dropped_no_address += 1
-                # Log the first few dropped addresses to debug
-                if dropped_no_address <= 5:
-                    print(
-                        f"DEBUG: Dropped client '{name}' - No address found in properties. Available keys: {list(props.keys())}"
+                client_data, place, page_id, page_edited = extracted
+                if place is None:
+                    # Coordinates came with the page (Place property or "lat, lng")
+                    entries_geocoded += 1
+                    clients_append(client_data)
+                else:
+                    # Defer geocoding for batch processing; page id and edit time
+                    # drive change-detection
+                    pending_append(
+                        (client_data, place, client_data["name"], page_id, page_edited)
                     )
-                    # Inspect 'Адреса' or 'АДРЕСА' specifically
-                    addr_debug = props.get("АДРЕСА") or props.get("Адреса")
-                    if addr_debug:
-                        print(
-                            f"DEBUG: Found 'Адреса' property content: {json.dumps(addr_debug, default=str)}"
-                        )
-                    else:
-                        print("DEBUG: 'Адреса' property is missing or None")
+        finally:
+            # Reap the load task even when the Notion stream fails, so it
+            # never outlives this call or leaves an unretrieved exception
+            try:
+                await cache_load
+            except Exception:
+                print("Could not load geocode cache.")
+
+        total_entries = entries_processed
+        print(f"Found {total_entries} total entries in database")
 
         # Batch geocode collected places with page-level change-detection using last_edited_time
         if pending_pages:
-            # Ensure cache loaded
-            try:
-                _load_geocode_cache()
-            except (ValueError, TypeError, OSError, PermissionError, IOError):
-                print("Could not load geocode cache.")
 
             # Group pending pages by normalized place
             place_map: dict = {}
 
             for client_data, plc, name, page_id, page_edited in pending_pages:
-                norm = " ".join(plc.strip().lower().split())
-                if norm not in place_map:
-                    place_map[norm] = {"place": plc, "pages": []}
-                place_map[norm]["pages"].append(
-                    {
-                        "client": client_data,
-                        "page_id": page_id,
-                        "edited": page_edited,
-                        "name": name,
-                    }
+                # Interned so duplicate places share one key object
+                norm = sys.intern(_norm_place(plc))
+                entry = place_map.get(norm)
+                if entry is None:
+                    entry = place_map[norm] = {"place": sys.intern(plc), "pages": []}
+                entry["pages"].append(
+                    _PendingPage(client_data, page_id, page_edited, name)
                 )
 
             # Decide which places actually need geocoding (if any page referencing them changed)
+            # Cache reads bound once for the per-page loops below; page-level
+            # writes are collected and applied under one lock acquisition.
+            cache_get = _geocode_cache_manager.get
+            pending_cache_writes: list[tuple[str, dict]] = []
             uniq_places: list[str] = []
             needs_geocode_for_place: dict = {}
 
@@ -331,87 +396,55 @@ async def fetch_clients_from_notion(api_key, database_id):
                 place = entry["place"]
                 pages = entry["pages"]
                 need_geo = False
+                # Address-level cache is looked up once per place; entries are
+                # raw coords (lat None = cached miss)
+                addr_cached = _cached_address(place)
+                addr_coords = None
+                if addr_cached is not None and addr_cached.get("lat") is not None:
+                    addr_coords = {
+                        "lat": addr_cached["lat"],
+                        "lng": addr_cached["lng"],
+                    }
                 for p in pages:
-                    pid = p.get("page_id")
-                    edited = p.get("edited") or ""
+                    pid = p.page_id
+                    edited = p.edited
                     page_key = f"page::{pid}" if pid else None
 
                     coords_found = False
 
                     page_cached = None
                     if page_key:
-                        page_cached = _geocode_cache_manager.get(page_key)
-
-                    # If page-specific cache exists and timestamps match
-                    if page_cached:
-                        # page_cached stored as {'coords': {...}, 'last_edited_time': ...}
-                        if isinstance(page_cached, dict) and page_cached.get("coords"):
-                            if page_cached.get("last_edited_time") == edited:
-                                coords = page_cached.get("coords")
-
-                                if coords:
-                                    p["client"]["lat"] = coords["lat"]
-                                    p["client"]["lng"] = coords["lng"]
-                                    coords_found = True
-
-                        # If page cache is a raw coords dict, assume valid
-                        if (
-                            not coords_found
-                            and isinstance(page_cached, dict)
-                            and page_cached.get("lat")
-                        ):
-                            coords = page_cached
-                            p["client"]["lat"] = coords.get("lat")
-                            p["client"]["lng"] = coords.get("lng")
+                        page_cached = cache_get(page_key)
+
+                    # Page entries are normalized at load to
+                    # {'coords': {...}, 'last_edited_time': ...}; a None
+                    # timestamp (legacy raw coords) matches any edit time.
+                    if page_cached is not None:
+                        stamp = page_cached["last_edited_time"]
+                        if stamp is None or stamp == edited:
+                            coords = page_cached["coords"]
+                            p.client["lat"] = coords["lat"]
+                            p.client["lng"] = coords["lng"]
                             coords_found = True
 
                     # Fall back to address-keyed cache if page cache didn't work
                     if not coords_found:
-                        addr_key = _geocode_cache_key(place)
-                        addr_cached = _geocode_cache_manager.get(addr_key)
-                        coords = None
-                        if addr_cached:
-                            # address cache may be {'coords': {...}} or raw coords
-                            if isinstance(addr_cached, dict) and addr_cached.get(
-                                "coords"
-                            ):
-                                coords = addr_cached.get("coords")
-                            elif isinstance(addr_cached, dict) and addr_cached.get(
-                                "lat"
-                            ):
-                                coords = {
-                                    "lat": addr_cached.get("lat"),
-                                    "lng": addr_cached.get("lng"),
-                                }
-
+                        coords = addr_coords
                         if coords:
                             # assign to client and create page-specific cache entry for faster next runs
-                            p["client"]["lat"] = coords["lat"]
-                            p["client"]["lng"] = coords["lng"]
+                            p.client["lat"] = coords["lat"]
+                            p.client["lng"] = coords["lng"]
                             coords_found = True
-                            try:
-                                pid = p.get("page_id")
-                                edited = p.get("edited") or ""
-                                if pid:
-                                    page_key = f"page::{pid}"
-                                    with _GEOCODE_CACHE_LOCK:
-                                        _geocode_cache_manager.set(
-                                            page_key,
-                                            {
-                                                "coords": coords,
-                                                "last_edited_time": edited,
-                                                "address": place,
-                                            },
-                                        )
-                            except (
-                                ValueError,
-                                TypeError,
-                                OSError,
-                                PermissionError,
-                                IOError,
-                            ):
-                                print(
-                                    "An error occurred while saving geocode cache for page."
+                            if pid:
+                                pending_cache_writes.append(
+                                    (
+                                        f"page::{pid}",
+                                        {
+                                            "coords": coords,
+                                            "last_edited_time": edited,
+                                            "address": place,
+                                        },
+                                    )
                                 )
 
                     # If we found coords from cache, mark as geocoded and don't re-query
@@ -426,10 +459,13 @@ async def fetch_clients_from_notion(api_key, database_id):
                     needs_geocode_for_place[place] = entry["pages"]
 
             t_geocode_start = time.time()
+            # batch_geocode is thread-pool based; keep it off the event loop
             coords_map = (
-                {}
-                if not uniq_places
-                else batch_geocode(uniq_places, max_workers=4, rate=4.0, burst=4)
+                await asyncio.to_thread(
+                    batch_geocode, uniq_places, max_workers=4, rate=4.0, burst=4
+                )
+                if uniq_places
+                else {}
             )
             t_geocode_end = time.time()
 
@@ -445,13 +481,13 @@ async def fetch_clients_from_notion(api_key, database_id):
                 pages = entry["pages"]
                 coords = coords_map.get(place)
                 for p in pages:
-                    client_obj = p["client"]
-                    pid = p.get("page_id")
-                    edited = p.get("edited") or ""
+                    client_obj = p.client
+                    pid = p.page_id
+                    edited = p.edited
 
                     # If client already has lat/lng from cache, it's already geocoded
                     if client_obj.get("lat") and client_obj.get("lng"):
-                        clients.append(client_obj)
+                        clients_append(client_obj)
                         continue
 
                     # Otherwise, try to use coords from batch result
@@ -461,44 +497,33 @@ async def fetch_clients_from_notion(api_key, database_id):
                         client_obj["lng"] = coords["lng"]
 
                         # persist page-specific cache
-                        try:
-                            if pid:
-                                page_key = f"page::{pid}"
-                                with _GEOCODE_CACHE_LOCK:
-                                    _geocode_cache_manager.set(
-                                        page_key,
-                                        {
-                                            "coords": coords,
-                                            "last_edited_time": edited,
-                                            "address": place,
-                                        },
-                                    )
-                        except (
-                            ValueError,
-                            TypeError,
-                            OSError,
-                            PermissionError,
-                            IOError,
-                        ):
-                            print(
-                                "An error occurred while saving geocode cache for page."
+                        if pid:
+                            pending_cache_writes.append(
+                                (
+                                    f"page::{pid}",
+                                    {
+                                        "coords": coords,
+                                        "last_edited_time": edited,
+                                        "address": place,
+                                    },
+                                )
                             )
                     else:
                         # Geocoding failed — do NOT add to results (no valid coordinates)
-                        if "failed_geocodes" in locals():
-                            failed_geocodes.append(
-                                f"{client_obj.get('name', 'Unknown')} ({place})"
-                            )
-                        print(
-                            f"  ⚠️  Failed to geocode: {client_obj.get('name', 'Unknown')} - {place}"
+                        # Reported once in the summary instead of per page
+                        failed_geocodes.append(
+                            (client_obj.get("name", "Unknown"), place)
                         )
                         continue
 
-                    clients.append(client_obj)
+                    clients_append(client_obj)
 
-            # flush cache after processing
+            # apply page-level cache writes and flush cache after processing
             try:
                 with _GEOCODE_CACHE_LOCK:
+                    cache_set = _geocode_cache_manager.set
+                    for key, value in pending_cache_writes:
+                        cache_set(key, value)
                     _save_geocode_cache()
             except (
                 FileNotFoundError,
@@ -512,67 +537,107 @@ async def fetch_clients_from_notion(api_key, database_id):
 
         return clients
 
-    except (requests.RequestException, KeyError, ValueError, AttributeError) as e:
+    except (aiohttp.ClientError, KeyError, ValueError, AttributeError) as e:
         print(f"\nError fetching clients: {str(e)}\n")
         raise
 
     finally:
         print(f"\n--- Notion Fetch Summary ---")
         print(
-            f"Total entries fetched: {total_entries if 'total_entries' in locals() else 'Unknown'}"
+            f"Total entries fetched: {entries_processed}"
         )
-        print(f"Dropped (Source != 'БАЗА'): {dropped_source_mismatch}")
         print(f"Dropped (No Address/Coords): {dropped_no_address}")
         print(
             f"Passed to geocoding/processing: {len(clients) + len(pending_pages) if 'pending_pages' in locals() else 0}"
         )
-        if "failed_geocodes" in locals() and failed_geocodes:
-            print(f"\n--- FAILED GEOCODES ({len(failed_geocodes)}) ---")
-            for fail in failed_geocodes:
-                print(f" - {fail}")
+        if failed_geocodes:
+            lines = [f"\n--- FAILED GEOCODES ({len(failed_geocodes)}) ---"]
+            lines.extend(
+                f" - {name} ({place})" for name, place in failed_geocodes[:20]
+            )
+            if len(failed_geocodes) > 20:
+                lines.append(f" ... and {len(failed_geocodes) - 20} more")
+            print("\n".join(lines))
         print(f"----------------------------\n")
 
 
+# Fetched clients are cached on disk per (API key, database) so repeat widget
+# regenerations within NOTION_CACHE_TTL seconds skip Notion entirely. The key
+# is part of the file name because a cache hit never asks Notion to check it:
+# a request with another key must not be served this key's clients.
+_NOTION_CACHE_TTL = 600
+
+
+def _notion_cache_path(api_key: str, database_id: str) -> str:
+    digest = hashlib.sha256(f"{api_key}\0{database_id}".encode("utf-8")).hexdigest()[:32]
+    return os.path.join(tempfile.gettempdir(), f"notion_clients_{digest}.json")
+
+
+async def fetch_clients_cached(api_key, database_id, use_cache=True):
+    """Return `fetch_clients_from_notion` results, reusing a fresh disk copy.
+
+    The cache file lives in the system temp dir; its age is checked against
+    NOTION_CACHE_TTL (seconds, default 600). Pass use_cache=False to force a
+    fetch; the result is written back either way.
+    """
+    try:
+        ttl = float(os.environ.get("NOTION_CACHE_TTL", _NOTION_CACHE_TTL))
+    except ValueError:
+        ttl = _NOTION_CACHE_TTL
+    path = _notion_cache_path(api_key, database_id)
+
+    if use_cache and ttl > 0:
+        try:
+            if time.time() - os.path.getmtime(path) < ttl:
+                with open(path, "rb") as fh:
+                    clients = json_loads(fh.read())["clients"]
+                print(f"Using cached Notion clients ({len(clients)}) from {path}")
+                return clients
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # missing or unreadable cache: fall through to a fetch
+
+    clients = await fetch_clients_from_notion(api_key, database_id)
+
+    try:
+        _write_json_atomic(path, {"fetched_at": time.time(), "clients": clients})
+    except (OSError, TypeError, ValueError):
+        print("⚠ Warning: Could not write Notion clients cache.")
+    return clients
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Streaming helpers — used by the SSE endpoint for live Notion loading
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _extract_client_from_page(page):
+def _extract_client_from_page(page, check_latlng=True):
     """Extract client data from a single Notion page.
 
     Returns (client_data, place, page_id, page_edited) when valid,
-    or None when the page should be skipped (wrong Source / no address).
+    or None when the page should be skipped (no address). Source filtering
+    happens server-side in the Notion query.
     client_data already has lat/lng set when latlng was embedded in the page;
-    in that case place is None and geocoding is not needed.
+    in that case place is None and geocoding is not needed. With
+    check_latlng=False, "lat, lng" place strings are left for the caller
+    (see _resolve_latlng_places).
     """
     props = page.get("properties", {})
-
-    # Filter: Source must equal "БАЗА"
-    source_prop = props.get("Source") or props.get("source")
-    source_value = None
-    if source_prop:
-        if source_prop.get("type") == "select" and source_prop.get("select"):
-            source_value = source_prop["select"].get("name", "")
-        elif source_prop.get("type") == "rich_text" and source_prop.get("rich_text"):
-            source_value = source_prop["rich_text"][0]["plain_text"] if source_prop["rich_text"] else ""
-    if source_value != "БАЗА":
-        return None
+    pget = props.get
 
     # Name
-    name_prop = props.get("Name") or props.get("name")
+    name_prop = pget("Name") or pget("name")
     name = "Unnamed"
     if name_prop and name_prop.get("title"):
         name = name_prop["title"][0]["plain_text"] if name_prop["title"] else "Unnamed"
 
     # Phone
     phone = ""
-    phone_prop = props.get("ТЕЛЕФОН") or props.get("Phone")
+    phone_prop = pget("ТЕЛЕФОН") or pget("Phone")
     if phone_prop and phone_prop.get("rich_text") and phone_prop["rich_text"]:
         phone = phone_prop["rich_text"][0]["plain_text"]
 
     # Email
     email = ""
-    email_prop = props.get("ЕЛ.АДРЕСА") or props.get("Email") or props.get("E-mail 1 - Value")
+    email_prop = pget("ЕЛ.АДРЕСА") or pget("Email") or pget("E-mail 1 - Value")
     if email_prop:
         if email_prop.get("type") == "email":
             email = email_prop.get("email") or ""
@@ -581,13 +646,13 @@ def _extract_client_from_page(page):
 
     # Contact
     contact = ""
-    contact_prop = props.get("КОНТАКТ")
+    contact_prop = pget("КОНТАКТ")
     if contact_prop and contact_prop.get("rich_text") and contact_prop["rich_text"]:
         contact = contact_prop["rich_text"][0]["plain_text"]
 
     # Notes
     notes = ""
-    notes_prop = props.get("ПРИМІТКА") or props.get("Notes")
+    notes_prop = pget("ПРИМІТКА") or pget("Notes")
     if notes_prop and notes_prop.get("rich_text") and notes_prop["rich_text"]:
         notes = notes_prop["rich_text"][0]["plain_text"]
         if len(notes) > 100:
@@ -595,36 +660,34 @@ def _extract_client_from_page(page):
 
     # Organization title
     org_title = ""
-    org_title_prop = props.get("Organization Title")
+    org_title_prop = pget("Organization Title")
     if org_title_prop and org_title_prop.get("select"):
         org_title = org_title_prop["select"].get("name", "")
 
     # Color / label
-    color_map = {
-        "gray": "#6b7280", "brown": "#92400e", "orange": "#ea580c",
-        "yellow": "#eab308", "green": "#16a34a", "blue": "#2563eb",
-        "purple": "#9333ea", "pink": "#db2777", "red": "#ef4444",
-        "default": "#6b7280",
-    }
-    label_color = "#ef4444"
+    label_color = _DEFAULT_LABEL_COLOR
     label_name = ""
-    labels_prop = props.get("Labels") or props.get("Label")
-    if labels_prop:
-        if labels_prop.get("type") == "multi_select" and labels_prop.get("multi_select"):
-            first = labels_prop["multi_select"][0]
-            label_color = color_map.get(first.get("color", "red"), "#ef4444")
-            label_name = first.get("name", "")
-        elif labels_prop.get("type") == "select" and labels_prop.get("select"):
-            label_color = color_map.get(labels_prop["select"].get("color", "red"), "#ef4444")
-            label_name = labels_prop["select"].get("name", "")
+    labels_prop = pget("Labels")
+    if labels_prop is None:
+        labels_prop = pget("Label")
+    if labels_prop is not None and (
+        label_type := labels_prop.get("type")
+    ) in ("multi_select", "select"):
+        label_value = labels_prop.get(label_type)
+        if label_value:
+            if label_type == "multi_select":
+                label_value = label_value[0]
+            # A missing color falls through to the default (red)
+            label_color = _NOTION_COLOR_MAP.get(label_value.get("color"), _DEFAULT_LABEL_COLOR)
+            label_name = label_value.get("name", "")
 
     # Address / coordinates
     place = ""
     address_display = ""
     latlng = None
 
-    for candidate_key in ["АДРЕСА", "Адреса", "Address 1 - Formatted"]:
-        candidate_prop = props.get(candidate_key)
+    for candidate_key in _ADDRESS_CANDIDATE_KEYS:
+        candidate_prop = pget(candidate_key)
         if candidate_prop and candidate_prop.get("rich_text"):
             txt = candidate_prop["rich_text"][0]["plain_text"] if candidate_prop["rich_text"] else ""
             if txt and txt.strip():
@@ -633,7 +696,7 @@ def _extract_client_from_page(page):
                 break
 
     if not latlng and not place:
-        place_prop = props.get("Place") or props.get("place")
+        place_prop = pget("Place") or pget("place")
         if place_prop and place_prop.get("type") == "place":
             loc = place_prop.get("place")
             if loc:
@@ -645,7 +708,7 @@ def _extract_client_from_page(page):
                     address_display = place
 
     if not latlng and not place:
-        addr_formatted = props.get("Address 1 - Formatted")
+        addr_formatted = pget("Address 1 - Formatted")
         if addr_formatted and addr_formatted.get("rich_text"):
             txt = addr_formatted["rich_text"][0]["plain_text"] if addr_formatted["rich_text"] else ""
             if txt and txt.strip():
@@ -654,10 +717,13 @@ def _extract_client_from_page(page):
 
     if not latlng and not place:
         parts = []
-        for key in ["Address 1 - Street", "Address 1 - City", "Address 1 - Region", "Address 1 - Country"]:
-            comp = props.get(key)
-            if comp and comp.get("rich_text"):
-                txt = comp["rich_text"][0]["plain_text"] if comp["rich_text"] else ""
+        for key in _ADDRESS_COMPONENT_KEYS:
+            comp = pget(key)
+            if comp is None:
+                continue
+            rt = comp.get("rich_text")
+            if rt:
+                txt = rt[0]["plain_text"]
                 if txt and txt.strip():
                     parts.append(txt)
         if parts:
@@ -677,17 +743,14 @@ def _extract_client_from_page(page):
 
     if place:
         # Already a lat,lng string?
-        if "," in place and place.count(",") == 1:
-            try:
-                parts = place.split(",")
-                lat = float(parts[0].strip())
-                lng = float(parts[1].strip())
-                if -90 <= lat <= 90 and -180 <= lng <= 180:
-                    client_data["lat"] = lat
-                    client_data["lng"] = lng
-                    return (client_data, None, None, None)
-            except (ValueError, IndexError):
-                pass
+        m = _LATLNG_RE.match(place) if check_latlng else None
+        if m:
+            lat = float(m.group(1))
+            lng = float(m.group(2))
+            if -90 <= lat <= 90 and -180 <= lng <= 180:
+                client_data["lat"] = lat
+                client_data["lng"] = lng
+                return (client_data, None, None, None)
         page_id = page.get("id")
         page_edited = page.get("last_edited_time") or ""
         return (client_data, place, page_id, page_edited)
@@ -724,21 +787,16 @@ def _resolve_batch(items):
         if page_id:
             page_key = f"page::{page_id}"
             pc = _geocode_cache_manager.get(page_key)
-            if pc and isinstance(pc, dict):
-                if pc.get("coords") and pc.get("last_edited_time") == page_edited:
+            if pc is not None:
+                stamp = pc["last_edited_time"]
+                if stamp is None or stamp == page_edited:
                     coords = pc["coords"]
-                elif pc.get("lat"):
-                    coords = {"lat": pc["lat"], "lng": pc["lng"]}
 
         # Address-level cache fallback
         if not coords:
-            addr_key = _geocode_cache_key(place)
-            ac = _geocode_cache_manager.get(addr_key)
-            if ac and isinstance(ac, dict):
-                if ac.get("coords"):
-                    coords = ac["coords"]
-                elif ac.get("lat"):
-                    coords = {"lat": ac["lat"], "lng": ac["lng"]}
+            ac = _cached_address(place)
+            if ac is not None and ac.get("lat") is not None:
+                coords = {"lat": ac["lat"], "lng": ac["lng"]}
 
         if coords:
             client_data["lat"] = coords["lat"]
@@ -784,8 +842,14 @@ def stream_clients_from_notion(api_key, database_id, batch_size=25):
     Clients whose addresses are already in the geocode cache are returned
     almost instantly; uncached ones are geocoded just-in-time.
     """
-    notion_data = asyncio.run(fetch_notion_data(api_key, database_id))
-    pages = notion_data.get("results", [])
+    async def _collect():
+        return [
+            page
+            async for results in _iter_synced_pages(api_key, database_id)
+            for page in results
+        ]
+
+    pages = asyncio.run(_collect())
 
     pending = []  # list of (client_data, place, page_id, page_edited)
     for page in pages:
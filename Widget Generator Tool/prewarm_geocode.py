@@ -4,11 +4,18 @@ Run: python3 "Widget Generator Tool/prewarm_geocode.py"
 Uses NOTION_API_KEY and NOTION_DATABASE_ID from environment or .env.
 """
 
+import asyncio
 import os
 import time
 from pathlib import Path
 
-from utils import fetch_notion_data, _load_env_with_exports, batch_geocode
+from utils import (
+    fetch_notion_data,
+    _load_env_with_exports,
+    _norm_place,
+    _notion_source_filter,
+    batch_geocode,
+)
 from dotenv import load_dotenv
 
 # Load .env files: repo root and local tool .env (supports `export ` lines)
@@ -25,7 +32,7 @@ if not API_KEY or not DB_ID:
     raise SystemExit(1)
 
 print("Fetching Notion database to collect addresses...")
-ndata = fetch_notion_data(API_KEY, DB_ID)
+ndata = asyncio.run(fetch_notion_data(API_KEY, DB_ID, filter_=_notion_source_filter()))
 results = ndata.get("results", [])
 print(f"Found {len(results)} entries")
 
@@ -70,7 +77,7 @@ for page in results:
 seen = set()
 uniq = []
 for p in places:
-    k = " ".join(p.strip().lower().split())
+    k = _norm_place(p)
     if k in seen:
         continue
     seen.add(k)
@@ -5,6 +5,8 @@ This module contains all HTML template strings used to generate
 the client map widget and related pages.
 """
 
+from utils import client_bounds, iter_client_columns, json_dumps
+
 GENERATOR_HTML = """
 <!DOCTYPE html>
 <html lang="en">
@@ -218,12 +220,15 @@ GENERATOR_HTML = """
                     body: JSON.stringify({ apiKey, databaseId })
                 });
                 
-                const data = await response.json();
+                const job = await response.json();
                 
                 if (!response.ok) {
-                    throw new Error(data.error || 'Failed to generate widget');
+                    throw new Error(job.error || 'Failed to generate widget');
                 }
                 
+                // Generation runs as a background job; poll until it finishes
+                const data = await pollJob(job.status_url);
+                
                 // Store widget info for later use
                 window.currentWidgetId = data.widget_id;
                 window.currentPreviewUrl = data.preview_url;
@@ -239,13 +244,13 @@ GENERATOR_HTML = """
                     throw new Error(widgetError.error || `Failed to retrieve widget HTML (${widgetResponse.status})`);
                 }
                 
-                const widgetData = await widgetResponse.json();
+                const widgetHtml = await widgetResponse.text();
                 
-                if (!widgetData.html) {
+                if (!widgetHtml) {
                     throw new Error('Widget HTML is empty or undefined');
                 }
                 
-                document.getElementById('widgetCode').value = widgetData.html;
+                document.getElementById('widgetCode').value = widgetHtml;
                 result.classList.add('show');
                 
                 // Update status message with widget info
@@ -258,7 +263,7 @@ GENERATOR_HTML = """
                 statusMsg.innerHTML = `
                     ✓ Generated widget for ${data.clients} clients (${data.size_mb} MB)<br>
                     Widget ID: <code style="background: white; padding: 2px 6px; border-radius: 3px;">${data.widget_id}</code><br>
-                    HTML Size: ${widgetData.size_mb} MB
+                    HTML Size: ${data.size_mb} MB
                 `;
                 result.insertBefore(statusMsg, result.firstChild);
                 
@@ -272,6 +277,18 @@ GENERATOR_HTML = """
             }
         });
         
+        async function pollJob(statusUrl) {
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                const statusResponse = await fetch(statusUrl);
+                const status = await statusResponse.json();
+                if (status.state === 'done') return status;
+                if (status.state !== 'pending') {
+                    throw new Error(status.error || `Widget generation failed (${statusResponse.status})`);
+                }
+            }
+        }
+        
         function copyWidget() {
             const textarea = document.getElementById('widgetCode');
             textarea.select();
@@ -287,8 +304,14 @@ GENERATOR_HTML = """
         
         // CSV/stored-client UI removed; no stored-count refresh needed.
         function openWidgetInTab() {
-            // Use the stored preview URL to open widget directly (no POST needed!)
-            if (window.currentPreviewUrl) {
+            // The generated HTML is already in the textarea, so open it from a
+            // blob URL instead of downloading it again from the server.
+            const widgetHtml = document.getElementById('widgetCode').value;
+            if (widgetHtml) {
+                const url = URL.createObjectURL(new Blob([widgetHtml], { type: 'text/html' }));
+                window.open(url, '_blank');
+                setTimeout(() => URL.revokeObjectURL(url), 60000);
+            } else if (window.currentPreviewUrl) {
                 window.open(window.currentPreviewUrl, '_blank');
             } else {
                 alert('Please generate a widget first');
@@ -300,8 +323,11 @@ GENERATOR_HTML = """
 """
 
 
+# Filled by render_widget/write_widget: __CLIENTS_JSON__ marks where the
+# payload goes, so the markup keeps plain (undoubled) braces.
 INLINE_MAP_TEMPLATE = """<!DOCTYPE html>
 <html lang="en">
+
 <head>
     <meta charset="UTF-8" />
     <meta name="viewport" content="width=device-width, initial-scale=1.0" />
@@ -309,76 +335,208 @@ INLINE_MAP_TEMPLATE = """<!DOCTYPE html>
     <link href="https://unpkg.com/maplibre-gl@3.6.1/dist/maplibre-gl.css" rel="stylesheet" />
     <script src="https://unpkg.com/maplibre-gl@3.6.1/dist/maplibre-gl.js"></script>
     <style>
-        html, body {{ height: 100%; margin: 0; }}
-        #map {{ position: fixed; inset: 0; }}
-        .maplibregl-popup {{
+        @font-face {
+            font-family: 'Rubik One Local';
+            src: url('Rubik.ttf') format('truetype');
+            font-style: normal;
+            font-display: swap;
+        }
+
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+            font-family: 'Rubik One Local', -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+            font-weight: 400;
+        }
+
+        #map {
+            position: fixed;
+            inset: 0;
+        }
+
+        .maplibregl-popup {
             z-index: 10000 !important;
             max-width: 320px !important;
-        }}
-        .maplibregl-popup-content {{
+        }
+
+        #controls {
+            position: absolute;
+            top: 14px;
+            left: 14px;
+            z-index: 10001;
+            background: rgba(255, 255, 255, 0.98);
+            padding: 10px 12px;
+            border-radius: 12px;
+            border: 1px solid rgba(15, 23, 42, 0.04);
+            box-shadow: 0 10px 30px rgba(2, 6, 23, 0.12);
+            display: flex;
+            gap: 12px;
+            align-items: center;
+        }
+
+        .search-wrapper {
+            position: relative;
+            display: flex;
+            align-items: center;
+            min-width: 260px;
+        }
+
+        .search-icon {
+            position: absolute;
+            left: 10px;
+            width: 16px;
+            height: 16px;
+            color: #6b7280;
+            pointer-events: none;
+        }
+
+        #search {
+            width: 100%;
+            padding: 8px 36px 8px 34px;
+            border-radius: 10px;
+            border: 1px solid #e6eef8;
+            outline: none;
+            font-size: 14px;
+            box-shadow: inset 0 1px 4px rgba(16, 24, 40, 0.03);
+            transition: box-shadow 0.15s, border-color 0.15s;
+            background: transparent;
+        }
+
+        #search:focus {
+            box-shadow: 0 6px 18px rgba(37, 99, 235, 0.12);
+            border-color: rgba(37, 99, 235, 0.6);
+        }
+
+        #clear-btn {
+            position: absolute;
+            right: 8px;
+            background: transparent;
+            border: none;
+            font-size: 16px;
+            color: #9ca3af;
+            cursor: pointer;
+            padding: 4px;
+            display: none;
+        }
+
+        #clear-btn:hover {
+            color: #374151;
+        }
+
+        .suggestions {
+            position: absolute;
+            top: calc(100% + 8px);
+            left: 0;
+            right: 0;
+            background: white;
+            border: 1px solid #e6eef8;
+            box-shadow: 0 6px 20px rgba(2, 6, 23, 0.12);
+            border-radius: 10px;
+            max-height: 220px;
+            overflow: auto;
+            z-index: 10002;
+            display: none;
+        }
+
+        .suggestion-item {
+            padding: 10px 12px;
+            font-size: 14px;
+            color: #111827;
+            cursor: pointer;
+        }
+
+        .suggestion-item:hover {
+            background: #f8fafc;
+        }
+
+        .maplibregl-popup-content {
             font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
             font-size: 13px;
             color: #111827;
             padding: 0;
             border-radius: 12px;
-            box-shadow: 0 4px 20px rgba(0,0,0,0.2);
+            box-shadow: 0 4px 20px rgba(0, 0, 0, 0.2);
             overflow: hidden;
-        }}
-        .maplibregl-popup-close-button {{
+        }
+
+        .maplibregl-popup-close-button {
             font-size: 18px;
             padding: 8px 12px;
             color: #6b7280;
             right: 4px;
             top: 4px;
-        }}
-        .maplibregl-popup-close-button:hover {{
+        }
+
+        .maplibregl-popup-close-button:hover {
             background: transparent;
             color: #111827;
-        }}
-        .popup-header {{
+        }
+
+        .popup-header {
             padding: 16px 16px 12px;
             border-bottom: 1px solid #e5e7eb;
             background: #f9fafb;
-        }}
-        .popup-name {{
+        }
+
+        .popup-name {
             font-size: 15px;
             font-weight: 600;
             color: #111827;
             margin: 0 0 4px 0;
             padding-right: 20px;
-        }}
-        .popup-label {{
+        }
+
+        .popup-label {
             display: inline-block;
-            font-size: 11px;
+            font-size: 10px;
             font-weight: 500;
-            padding: 2px 8px;
-            border-radius: 12px;
+            padding: 2px 6px;
+            border-radius: 4px;
+            margin-bottom: 8px;
             color: white;
-        }}
-        .popup-body {{
+            /* Popups only set --lbl per label; the rest is static */
+            background-color: var(--lbl, #ef4444);
+        }
+
+        .popup-body {
             padding: 12px 16px;
-        }}
-        .popup-row {{
+        }
+
+        .popup-row {
             display: flex;
             align-items: flex-start;
             margin-bottom: 8px;
             gap: 8px;
-        }}
-        .popup-row:last-child {{
+        }
+
+        .popup-row:last-child {
             margin-bottom: 0;
-        }}
-        .popup-value {{
+        }
+
+        .popup-icon {
+            width: 16px;
+            height: 16px;
+            flex-shrink: 0;
+            margin-top: 2px;
+            color: #9ca3af;
+        }
+
+        .popup-value {
             color: #374151;
             word-break: break-word;
-        }}
-        .popup-value a {{
+        }
+
+        .popup-value a {
             color: #2563eb;
             text-decoration: none;
-        }}
-        .popup-value a:hover {{
+        }
+
+        .popup-value a:hover {
             text-decoration: underline;
-        }}
-        .popup-notes {{
+        }
+
+        .popup-notes {
             font-size: 12px;
             color: #6b7280;
             font-style: italic;
@@ -386,255 +544,607 @@ INLINE_MAP_TEMPLATE = """<!DOCTYPE html>
             padding: 8px 12px;
             border-radius: 6px;
             margin-top: 8px;
-        }}
+        }
+
+        .popup-coords {
+            font-size: 11px;
+            color: #9ca3af;
+            margin-top: 8px;
+            padding-top: 8px;
+            border-top: 1px solid #e5e7eb;
+        }
     </style>
 </head>
+
 <body>
+    <div id="controls">
+        <div class="search-wrapper">
+            <svg class="search-icon" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
+                <circle cx="11" cy="11" r="7" />
+                <line x1="21" y1="21" x2="16.65" y2="16.65" />
+            </svg>
+            <input id="search" type="search" placeholder="Пошук..." autocomplete="off" />
+            <button id="clear-btn" aria-label="Clear search">×</button>
+            <div id="suggestions" class="suggestions" role="listbox"></div>
+        </div>
+    </div>
     <div id="map"></div>
+    <script id="clients-data" type="application/json">__CLIENTS_JSON__</script>
     <script>
-        var clients = {clients_json};
-
-        function clientsToGeoJSON(list) {{
-            return {{
-                type: 'FeatureCollection',
-                features: list
-                    .filter(function(c) {{ return c.lat != null && c.lng != null; }})
-                    .map(function(c, i) {{
-                        return {{
-                            type: 'Feature',
-                            geometry: {{ type: 'Point', coordinates: [c.lng, c.lat] }},
-                            properties: {{
-                                name: c.name || '', color: c.color || '#ef4444',
-                                phone: c.phone || '', email: c.email || '',
-                                contact: c.contact || '', address: c.address || '',
-                                notes: c.notes || '', label: c.label || '',
-                                orgTitle: c.orgTitle || ''
-                            }}
-                        }};
-                    }})
-            }};
-        }}
-
-        function buildPopupHTML(clientsAtLocation) {{
-            var html = '<div style="max-height:300px; overflow-y:auto;">';
-            clientsAtLocation.forEach(function(c, index) {{
-                html += '<div' + (index > 0 ? ' style="border-top:1px solid #efefef;padding-top:12px;margin-top:12px;"' : '') + '>';
-                html += '<div class="popup-header">';
-                var headerText = clientsAtLocation.length > 1 ? '(' + (index+1) + ') ' + escapeHtml(c.name) : escapeHtml(c.name);
-                html += '<div class="popup-name">' + headerText + '</div>';
-                if (c.label) {{
-                    html += '<span class="popup-label" style="background-color:' + (c.color || '#ef4444') + '">' + escapeHtml(c.label) + '</span>';
-                }}
-                html += '</div><div class="popup-body">';
-                if (c.address) {{ html += '<div class="popup-row">&#128205; <span class="popup-value">' + escapeHtml(c.address) + '</span></div>'; }}
-                if (c.notes) {{ html += '<div class="popup-notes">' + escapeHtml(c.notes) + '</div>'; }}
-                html += '</div></div>';
-            }});
-            html += '</div>';
-            return html;
-        }}
-
-        function escapeHtml(text) {{
-            if (!text) return '';
-            var div = document.createElement('div');
-            div.textContent = text;
-            return div.innerHTML;
-        }}
-
-        var fullGeoJSON = clientsToGeoJSON(clients);
-
-        var map = new maplibregl.Map({{
+        // Clients arrive as parallel arrays (one per field) to keep the payload
+        // small. The GeoJSON features are built from them in one pass and share
+        // their properties objects with `clients`; the server already dropped
+        // clients without coordinates. The payload is a JSON data block rather
+        // than a JS literal, so the browser runs JSON.parse instead of the full
+        // JS parser over it.
+        const columns = JSON.parse(document.getElementById('clients-data').textContent);
+        const initialBounds = columns.bbox;  // [[minLng, minLat], [maxLng, maxLat]] or null
+        const clients = [];
+        const features = [];
+        for (let i = 0; i < columns.name.length; i++) {
+            const c = {
+                _index: i,
+                name: columns.name[i] || '',
+                lat: columns.lat[i],
+                lng: columns.lng[i],
+                color: columns.color[i] || '#ef4444',
+                _s: columns._s[i],  // lowercase search text, built server-side
+                _k: coordKey(columns.lat[i], columns.lng[i])
+            };
+            // Optional fields are only set when present: every property is
+            // copied to the map worker with the source data
+            if (columns.address[i]) c.address = columns.address[i];
+            if (columns.notes[i]) c.notes = columns.notes[i];
+            if (columns.label[i]) c.label = columns.label[i];
+            clients.push(c);
+            features.push({
+                type: 'Feature',
+                geometry: { type: 'Point', coordinates: [c.lng, c.lat] },
+                properties: c
+            });
+        }
+
+        function featureCollection(list) {
+            return { type: 'FeatureCollection', features: list };
+        }
+
+        // Co-located clients grouped by coordinates quantized to 1e-6 degrees
+        // (each client's `_k`, computed once above), so popups look them up
+        // instead of scanning every client per click.
+        function coordKey(lat, lng) {
+            return Math.round(lat * 1e6) + ':' + Math.round(lng * 1e6);
+        }
+        const coloMap = new Map();
+        clients.forEach(function(c) {
+            var group = coloMap.get(c._k);
+            if (group) {
+                group.push(c);
+            } else {
+                coloMap.set(c._k, [c]);
+            }
+        });
+
+        // Popup node prototypes, styled once; buildPopupFragment clones them
+        // and fills in textContent, which also takes care of HTML escaping
+        function popupNode(className, cssText) {
+            var el = document.createElement('div');
+            if (className) el.className = className;
+            if (cssText) el.style.cssText = cssText;
+            return el;
+        }
+
+        var POPUP_ROOT = popupNode('', 'max-height:300px; overflow-y:auto;');
+        var POPUP_ITEM_FIRST = popupNode('', '');
+        var POPUP_ITEM_NEXT = popupNode('', 'border-top: 1px solid #efefef; padding-top: 12px; margin-top: 12px;');
+        var POPUP_HEADER = popupNode('popup-header', '');
+        var POPUP_NAME = popupNode('popup-name', 'font-weight:600; font-size:14px; margin-bottom:4px;');
+        var POPUP_LABEL = popupNode('popup-label', '');
+        var POPUP_BODY = popupNode('popup-body', 'font-size:13px; color:#374151;');
+        var POPUP_ADDRESS = popupNode('popup-row', 'display:flex; align-items:start; gap:6px; margin-bottom:4px;');
+        POPUP_ADDRESS.innerHTML = '<span style="font-weight:500;">&#128205;</span> <span class="popup-value"></span>';
+        var POPUP_NOTES = popupNode('popup-notes', 'background:#f3f4f6; padding:6px; border-radius:4px; margin-top:6px; font-style:italic; font-size:12px;');
+
+        function buildPopupFragment(clientsAtLocation) {
+            var numbered = clientsAtLocation.length > 1;
+            var root = POPUP_ROOT.cloneNode(false);
+
+            for (var i = 0; i < clientsAtLocation.length; i++) {
+                var c = clientsAtLocation[i];
+                var item = (i > 0 ? POPUP_ITEM_NEXT : POPUP_ITEM_FIRST).cloneNode(false);
+                var header = POPUP_HEADER.cloneNode(false);
+
+                var name = POPUP_NAME.cloneNode(false);
+                name.textContent = (numbered ? '(' + (i + 1) + ') ' : '') + (c.name || '');
+                header.appendChild(name);
+
+                if (c.label) {
+                    var label = POPUP_LABEL.cloneNode(false);
+                    if (c.color) label.style.setProperty('--lbl', c.color);
+                    label.textContent = c.label;
+                    header.appendChild(label);
+                }
+                item.appendChild(header);
+
+                var body = POPUP_BODY.cloneNode(false);
+                if (c.address) {
+                    var row = POPUP_ADDRESS.cloneNode(true);
+                    row.lastChild.textContent = c.address;
+                    body.appendChild(row);
+                }
+                if (c.notes) {
+                    var notes = POPUP_NOTES.cloneNode(false);
+                    notes.textContent = c.notes;
+                    body.appendChild(notes);
+                }
+                item.appendChild(body);
+                root.appendChild(item);
+            }
+
+            var fragment = document.createDocumentFragment();
+            fragment.appendChild(root);
+            return fragment;
+        }
+
+        var fullGeoJSON = featureCollection(features);
+        var CLUSTER_MAX_ZOOM = 14;
+        var SOURCE_MAX_ZOOM = CLUSTER_MAX_ZOOM + 1;
+        var MAX_CLUSTER_POPUP = 200;
+
+        var map = new maplibregl.Map({
             container: 'map',
-            style: {{
+            style: {
                 version: 8,
-                glyphs: 'https://fonts.openmaptiles.org/{{fontstack}}/{{range}}.pbf',
-                sources: {{
-                    osm: {{
+                glyphs: 'https://fonts.openmaptiles.org/{fontstack}/{range}.pbf',
+                sources: {
+                    osm: {
                         type: 'raster',
-                        tiles: ['https://cartodb-basemaps-a.global.ssl.fastly.net/light_all/{{z}}/{{x}}/{{y}}.png'],
+                        tiles: ['https://tile.openstreetmap.org/{z}/{x}/{y}.png'],
                         tileSize: 256,
-                        attribution: '&copy; OpenStreetMap contributors, &copy; CartoDB'
-                    }}
-                }},
-                layers: [{{ id: 'osm', type: 'raster', source: 'osm' }}]
-            }},
+                        attribution: '&copy; OpenStreetMap contributors'
+                    }
+                },
+                layers: [{ id: 'osm', type: 'raster', source: 'osm' }]
+            },
             center: [30.5241361, 50.4500336],
             zoom: 5
-        }});
+        });
 
-        map.on('load', function() {{
+        // One popup reused by every handler. It doesn't use closeOnClick: a
+        // click on another marker re-targets it, and a click on empty map
+        // closes it (see the map click handler below).
+        var popup = new maplibregl.Popup({ closeOnClick: false });
+
+        function showPopup(lngLat, maxWidth) {
+            popup.setMaxWidth(maxWidth).setLngLat(lngLat);
+            if (!popup.isOpen()) {
+                popup.addTo(map);
+            }
+            return popup;
+        }
+
+        map.on('load', function() {
             if (clients.length === 0) return;
 
-            map.addSource('clients', {{
+            // Add clustered GeoJSON source. Past street level points stop
+            // clustering (co-located clients share one marker and popup), and
+            // pairs render as two markers instead of a cluster.
+            map.addSource('clients', {
                 type: 'geojson',
                 data: fullGeoJSON,
+                // Point-only data: no tile buffer needed, and tiles past
+                // SOURCE_MAX_ZOOM are overzoomed instead of being generated
+                maxzoom: SOURCE_MAX_ZOOM,
+                buffer: 0,
                 cluster: true,
-                clusterMaxZoom: 24,
-                clusterRadius: 50
-            }});
+                clusterMaxZoom: CLUSTER_MAX_ZOOM,
+                clusterRadius: 60,
+                clusterMinPoints: 3
+            });
 
-            map.addLayer({{
-                id: 'clusters', type: 'circle', source: 'clients',
+            // Cluster circles — sized and colored by point count
+            map.addLayer({
+                id: 'clusters',
+                type: 'circle',
+                source: 'clients',
                 filter: ['has', 'point_count'],
-                paint: {{
-                    'circle-color': ['step', ['get', 'point_count'], '#f87171', 10, '#ef4444', 30, '#dc2626', 100, '#b91c1c'],
-                    'circle-radius': ['step', ['get', 'point_count'], 18, 10, 24, 30, 30, 100, 36],
+                paint: {
+                    'circle-color': [
+                        'step',
+                        ['get', 'point_count'],
+                        '#f87171',
+                        10, '#ef4444',
+                        30, '#dc2626',
+                        100, '#b91c1c'
+                    ],
+                    'circle-radius': [
+                        'step',
+                        ['get', 'point_count'],
+                        18,
+                        10, 24,
+                        30, 30,
+                        100, 36
+                    ],
                     'circle-stroke-width': 2,
                     'circle-stroke-color': '#ffffff'
-                }}
-            }});
+                }
+            });
 
-            map.addLayer({{
-                id: 'cluster-count', type: 'symbol', source: 'clients',
+            // Cluster count labels
+            map.addLayer({
+                id: 'cluster-count',
+                type: 'symbol',
+                source: 'clients',
                 filter: ['has', 'point_count'],
-                layout: {{
+                layout: {
                     'text-field': ['get', 'point_count_abbreviated'],
                     'text-font': ['Open Sans Bold'],
                     'text-size': 13,
                     'text-allow-overlap': true
-                }},
-                paint: {{ 'text-color': '#ffffff' }}
-            }});
+                },
+                paint: {
+                    'text-color': '#ffffff'
+                }
+            });
 
-            map.addLayer({{
-                id: 'unclustered-point', type: 'circle', source: 'clients',
+            // Individual (unclustered) points
+            map.addLayer({
+                id: 'unclustered-point',
+                type: 'circle',
+                source: 'clients',
                 filter: ['!', ['has', 'point_count']],
-                paint: {{
+                paint: {
+                    'circle-color': '#ef4444',
+                    'circle-radius': 8,
+                    'circle-stroke-width': 2,
+                    'circle-stroke-color': '#ffffff'
+                }
+            });
+
+            // Unclustered copy of the data used while searching. Typing only
+            // swaps this layer's filter, so the clustered source is never
+            // re-indexed per keystroke.
+            map.addSource('clients-search', {
+                type: 'geojson',
+                data: fullGeoJSON,
+                maxzoom: SOURCE_MAX_ZOOM,
+                buffer: 0
+            });
+            map.addLayer({
+                id: 'search-point',
+                type: 'circle',
+                source: 'clients-search',
+                layout: { visibility: 'none' },
+                paint: {
                     'circle-color': '#ef4444',
                     'circle-radius': 8,
                     'circle-stroke-width': 2,
                     'circle-stroke-color': '#ffffff'
-                }}
-            }});
+                }
+            });
 
-            map.on('click', 'clusters', function(e) {{
-                var features = map.queryRenderedFeatures(e.point, {{ layers: ['clusters'] }});
+            // Click on cluster: zoom in or show popup at max zoom
+            map.on('click', 'clusters', function(e) {
+                var features = map.queryRenderedFeatures(e.point, { layers: ['clusters'] });
                 if (!features.length) return;
+
                 var clusterId = features[0].properties.cluster_id;
                 var pointCount = features[0].properties.point_count;
                 var clusterCoords = features[0].geometry.coordinates;
                 var source = map.getSource('clients');
-                source.getClusterExpansionZoom(clusterId, function(err, expansionZoom) {{
+
+                source.getClusterExpansionZoom(clusterId, function(err, expansionZoom) {
                     if (err) return;
-                    if (expansionZoom > 20 || expansionZoom <= map.getZoom()) {{
-                        source.getClusterLeaves(clusterId, Math.min(pointCount, 50), 0, function(err2, leaves) {{
+
+                    if (expansionZoom > CLUSTER_MAX_ZOOM || expansionZoom <= map.getZoom()) {
+                        // At max zoom — list the leaves, unless there are too many
+                        if (pointCount > MAX_CLUSTER_POPUP) {
+                            showPopup(clusterCoords, '360px')
+                                .setText('Zoom in to list all ' + pointCount + ' clients');
+                            return;
+                        }
+
+                        source.getClusterLeaves(clusterId, pointCount, 0, function(err2, leaves) {
                             if (err2 || !leaves) return;
-                            var popupClients = leaves.map(function(leaf) {{ return leaf.properties; }});
-                            new maplibregl.Popup({{ maxWidth: '360px' }})
-                                .setLngLat(clusterCoords)
-                                .setHTML(buildPopupHTML(popupClients))
-                                .addTo(map);
-                        }});
-                    }} else {{
-                        map.easeTo({{ center: clusterCoords, zoom: expansionZoom }});
-                    }}
-                }});
-            }});
-
-            map.on('click', 'unclustered-point', function(e) {{
+
+                            // Leaves carry the client's index; reuse the decoded objects
+                            var popupClients = leaves.map(function(leaf) {
+                                return clients[leaf.properties._index];
+                            });
+
+                            showPopup(clusterCoords, '360px')
+                                .setDOMContent(buildPopupFragment(popupClients));
+                        });
+                    } else {
+                        map.easeTo({
+                            center: clusterCoords,
+                            zoom: expansionZoom
+                        });
+                    }
+                });
+            });
+
+            // Click on individual point: show popup
+            function onPointClick(e) {
                 var feature = e.features[0];
                 var coords = feature.geometry.coordinates.slice();
-                var colocated = clients.filter(function(c) {{
-                    return c.lat != null && c.lng != null &&
-                        c.lat.toFixed(6) === coords[1].toFixed(6) &&
-                        c.lng.toFixed(6) === coords[0].toFixed(6);
-                }});
-                var popupClients = colocated.length > 0 ? colocated : [feature.properties];
-                new maplibregl.Popup({{ maxWidth: '320px' }})
-                    .setLngLat(coords)
-                    .setHTML(buildPopupHTML(popupClients))
-                    .addTo(map);
-            }});
-
-            map.on('mouseenter', 'clusters', function() {{ map.getCanvas().style.cursor = 'pointer'; }});
-            map.on('mouseleave', 'clusters', function() {{ map.getCanvas().style.cursor = ''; }});
-            map.on('mouseenter', 'unclustered-point', function() {{ map.getCanvas().style.cursor = 'pointer'; }});
-            map.on('mouseleave', 'unclustered-point', function() {{ map.getCanvas().style.cursor = ''; }});
-
-            var bounds = new maplibregl.LngLatBounds();
-            clients.forEach(function(c) {{
-                if (c.lat != null && c.lng != null) bounds.extend([c.lng, c.lat]);
-            }});
-            if (!bounds.isEmpty()) map.fitBounds(bounds, {{ padding: 50, maxZoom: 12 }});
-        }});
+                var props = feature.properties;
+
+                // Find all clients at the exact same coordinate (co-located)
+                var colocated = coloMap.get(props._k) || [];
+
+                var popupClients = colocated.length > 0 ? colocated : [props];
+
+                // Handle antimeridian wrapping
+                while (Math.abs(e.lngLat.lng - coords[0]) > 180) {
+                    coords[0] += e.lngLat.lng > coords[0] ? 360 : -360;
+                }
+
+                showPopup(coords, '320px')
+                    .setDOMContent(buildPopupFragment(popupClients));
+            }
+
+            map.on('click', 'unclustered-point', onPointClick);
+            map.on('click', 'search-point', onPointClick);
+
+            // Close the shared popup when the click didn't hit a marker
+            map.on('click', function(e) {
+                var hits = map.queryRenderedFeatures(e.point, {
+                    layers: ['clusters', 'unclustered-point', 'search-point']
+                });
+                if (!hits.length) {
+                    popup.remove();
+                }
+            });
+
+            // Cursor styling: one mousemove listener, at most one hit test per
+            // frame, and the canvas style is only written when it changes
+            var POINTER_LAYERS = ['clusters', 'unclustered-point', 'search-point'];
+            var canvas = map.getCanvas();
+            var lastCursor = '';
+            var hoverPoint = null;
+
+            function updateCursor() {
+                var point = hoverPoint;
+                hoverPoint = null;
+                var cursor = map.queryRenderedFeatures(point, { layers: POINTER_LAYERS }).length
+                    ? 'pointer'
+                    : '';
+                if (cursor !== lastCursor) {
+                    canvas.style.cursor = lastCursor = cursor;
+                }
+            }
+
+            map.on('mousemove', function(e) {
+                if (hoverPoint === null) {
+                    requestAnimationFrame(updateCursor);
+                }
+                hoverPoint = e.point;
+            });
+
+            // Fit bounds to show all markers (bbox precomputed server-side)
+            if (initialBounds) {
+                map.fitBounds(initialBounds, { padding: 50, maxZoom: 12 });
+            }
+
+            // Search functionality
+            var searchInput = document.getElementById('search');
+            var searchInputWrapper = document.querySelector('.search-wrapper');
+            var suggestionsBox = document.getElementById('suggestions');
+            var clearBtn = document.getElementById('clear-btn');
+            var debounceTimer = null;
+            var suggestTimer = null;
+            var lastSuggestQuery = null;
+            var runWhenIdle = window.requestIdleCallback || function(cb) { return setTimeout(cb, 0); };
+
+            var CLUSTER_LAYERS = ['clusters', 'cluster-count', 'unclustered-point'];
+            var searchActive = false;
+
+            function setSearchMode(active) {
+                if (active === searchActive) return;
+                searchActive = active;
+                CLUSTER_LAYERS.forEach(function(id) {
+                    map.setLayoutProperty(id, 'visibility', active ? 'none' : 'visible');
+                });
+                map.setLayoutProperty('search-point', 'visibility', active ? 'visible' : 'none');
+            }
+
+            function filterMapByQuery(q) {
+                var ql = (q || '').trim().toLowerCase();
+
+                if (!ql) {
+                    setSearchMode(false);
+                    return;
+                }
+
+                // `_s` is already lowercase; MapLibre does the substring match
+                map.setFilter('search-point', ['in', ql, ['get', '_s']]);
+                setSearchMode(true);
+            }
+
+            // Fixed pool of suggestion rows with one delegated click handler,
+            // so typing only rewrites text instead of creating nodes/listeners
+            var MAX_SUGGESTIONS = 10;
+            var suggestionMatches = [];
+            var suggestionItems = [];
+            for (var si = 0; si < MAX_SUGGESTIONS; si++) {
+                var item = document.createElement('div');
+                item.className = 'suggestion-item';
+                item.dataset.idx = si;
+                item.style.display = 'none';
+                suggestionsBox.appendChild(item);
+                suggestionItems.push(item);
+            }
+
+            function selectClient(client) {
+                // Reset filter to show all
+                filterMapByQuery('');
+
+                // Fly to client
+                map.flyTo({
+                    center: [client.lng, client.lat],
+                    zoom: Math.max(map.getZoom(), 14),
+                    essential: true
+                });
+
+                // Show popup after map finishes moving
+                map.once('moveend', function() {
+                    var colocated = coloMap.get(client._k) || [];
+
+                    showPopup([client.lng, client.lat], '320px')
+                        .setDOMContent(buildPopupFragment(colocated.length > 0 ? colocated : [client]));
+                });
+
+                searchInput.value = client.name;
+                suggestionsBox.style.display = 'none';
+                clearBtn.style.display = 'block';
+            }
+
+            suggestionsBox.addEventListener('click', function(e) {
+                var el = e.target.closest('.suggestion-item');
+                var client = el && suggestionMatches[+el.dataset.idx];
+                if (client) {
+                    selectClient(client);
+                }
+            });
+
+            function showSuggestions(q) {
+                var ql = (q || '').trim().toLowerCase();
+                // Skip the rebuild when the visible list already matches
+                if (ql === lastSuggestQuery && suggestionsBox.style.display === 'block') {
+                    return;
+                }
+                lastSuggestQuery = ql;
+                suggestionMatches = [];
+
+                if (ql) {
+                    for (var i = 0; i < clients.length && suggestionMatches.length < MAX_SUGGESTIONS; i++) {
+                        if (clients[i]._s.indexOf(ql) !== -1) {
+                            suggestionMatches.push(clients[i]);
+                        }
+                    }
+                }
+
+                if (suggestionMatches.length === 0) {
+                    suggestionsBox.style.display = 'none';
+                    return;
+                }
+
+                suggestionItems.forEach(function(div, idx) {
+                    var client = suggestionMatches[idx];
+                    if (client) {
+                        div.textContent = client.name + (client.address ? ' (' + client.address + ')' : '');
+                        div.style.display = '';
+                    } else {
+                        div.style.display = 'none';
+                    }
+                });
+
+                suggestionsBox.style.display = 'block';
+            }
+
+            searchInput.addEventListener('input', function(e) {
+                var val = e.target.value;
+                clearBtn.style.display = val ? 'block' : 'none';
+
+                // Debounce suggestions, and let map filtering wait for idle time
+                clearTimeout(suggestTimer);
+                suggestTimer = setTimeout(function() {
+                    showSuggestions(val);
+                }, 80);
+                clearTimeout(debounceTimer);
+                debounceTimer = setTimeout(function() {
+                    runWhenIdle(function() {
+                        filterMapByQuery(val);
+                    });
+                }, 200);
+            });
+
+            clearBtn.addEventListener('click', function() {
+                searchInput.value = '';
+                clearTimeout(suggestTimer);
+                clearTimeout(debounceTimer);
+                filterMapByQuery('');
+                suggestionsBox.style.display = 'none';
+                clearBtn.style.display = 'none';
+            });
+
+            document.addEventListener('click', function(e) {
+                if (!searchInputWrapper.contains(e.target)) {
+                    suggestionsBox.style.display = 'none';
+                }
+            });
+
+        });
+
     </script>
 </body>
+
 </html>"""
 
 
-NOTION_EMBED_TEMPLATE = """<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8" />
-    <meta name="viewport" content="width=device-width, initial-scale=1.0" />
-    <title>Client Map (Notion Link)</title>
-    <style>
-        :root {{ color-scheme: light dark; }}
-        html, body {{ height: 100%; margin: 0; }}
-        body {{ display: grid; place-items: center; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; }}
-        .card {{ max-width: 640px; margin: 24px; padding: 24px; border-radius: 12px; border: 1px solid #e5e7eb; background: #ffffff; box-shadow: 0 2px 8px rgba(0,0,0,0.04); }}
-        .title {{ font-size: 18px; font-weight: 600; color: #111827; margin-bottom: 8px; }}
-        .desc {{ font-size: 14px; color: #6b7280; margin-bottom: 16px; }}
-        .btn {{ display: inline-flex; align-items: center; gap: 8px; background: #2563eb; color: white; text-decoration: none; padding: 12px 16px; border-radius: 8px; font-weight: 600; }}
-        .btn:hover {{ background: #1d4ed8; }}
-        .btn svg {{ width: 18px; height: 18px; }}
-        @media (prefers-color-scheme: dark) {{
-            .card {{ border-color: #374151; background: #111827; }}
-            .title {{ color: #e5e7eb; }}
-            .desc {{ color: #9ca3af; }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="card">
-        <div class="title">Client Map in Notion</div>
-        <div class="desc">Open the map view in Notion. This avoids iframe restrictions and ensures it loads reliably.</div>
-        <a class="btn" href="{embed_url}" target="_blank" rel="noopener noreferrer">
-            <svg viewBox="0 0 24 24" fill="none" xmlns="http://www.w3.org/2000/svg"><path d="M14 3H21V10" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"/><path d="M10 14L21 3" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"/><path d="M21 14V21H3V3H10" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"/></svg>
-            Open Notion Map
-        </a>
-    </div>
-</body>
-</html>"""
+# INLINE_MAP_TEMPLATE split around its payload sentinel once at import time,
+# so rendering is a plain join.
+_TEMPLATE_HEAD, _, _TEMPLATE_TAIL = INLINE_MAP_TEMPLATE.partition("__CLIENTS_JSON__")
 
 
-NOTION_MAP_WIDGET_TEMPLATE = """<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8" />
-    <meta name="viewport" content="width=device-width, initial-scale=1.0" />
-    <title>Client Map</title>
-    <style>
-        :root {{ color-scheme: light dark; }}
-        html, body {{ 
-            height: 100%; 
-            margin: 0; 
-            padding: 0;
-            overflow: hidden;
-        }}
-        #notion-map-container {{ 
-            width: 100%; 
-            height: 100vh; 
-            position: relative;
-        }}
-        .loading {{
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            height: 100vh;
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            color: #666;
-        }}
-        iframe {{
-            border: none;
-            width: 100%;
-            height: 100%;
-        }}
-    </style>
-</head>
-<body>
-    <div id="notion-map-container">
-        {map_content}
-    </div>
-</body>
-</html>"""
+def _minify_markup(text: str) -> str:
+    """Drop indentation, blank lines and whole-line `//` comments.
+
+    Line breaks are kept, so JS automatic semicolon insertion still
+    behaves exactly as in the readable template.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return "\n".join(
+        line for line in lines if line and not line.startswith("//")
+    )
+
+
+_MIN_TEMPLATE_HEAD = _minify_markup(_TEMPLATE_HEAD)
+_MIN_TEMPLATE_TAIL = _minify_markup(_TEMPLATE_TAIL)
+
+
+def _script_json(value) -> str:
+    # Inside a JSON data block only "</script" (or "<!--") can end the tag
+    # early; escaping "<" covers both and JSON.parse reads it back unchanged.
+    return json_dumps(value).replace("<", "\\u003c")
+
+
+def _template_parts(minify: bool) -> tuple[str, str]:
+    if minify:
+        return _MIN_TEMPLATE_HEAD, _MIN_TEMPLATE_TAIL
+    return _TEMPLATE_HEAD, _TEMPLATE_TAIL
+
+
+def _iter_widget_payload(clients: list[dict], bounds=None):
+    """Yield the widget payload's (key, value) pairs: columns, then "bbox"."""
+    yield from iter_client_columns(clients)
+    yield "bbox", bounds if bounds is not None else client_bounds(clients)
+
+
+def render_widget(clients: list[dict], minify: bool = True, bounds=None) -> str:
+    """Render the map widget HTML for `clients` (columnar JSON payload).
+
+    `bounds` may be passed when the caller already has it (see
+    `utils.located_clients`); otherwise it is computed here.
+    """
+    head, tail = _template_parts(minify)
+    clients_json = _script_json(dict(_iter_widget_payload(clients, bounds)))
+    return "".join((head, clients_json, tail))
+
+
+def write_widget(clients: list[dict], fh, minify: bool = True, bounds=None) -> None:
+    """Write the map widget HTML for `clients` to the text file `fh`.
+
+    Same output as `render_widget`, but the payload is serialized one
+    column at a time, so the whole page never exists as a single string.
+    """
+    head, tail = _template_parts(minify)
+    fh.write(head)
+    fh.write("{")
+    for i, (field, values) in enumerate(_iter_widget_payload(clients, bounds)):
+        if i:
+            fh.write(",")
+        fh.write(f'"{field}":')
+        fh.write(_script_json(values))
+    fh.write("}")
+    fh.write(tail)
@@ -5,6 +5,7 @@ This module contains all helper functions for fetching data from Notion,
 geocoding locations, and processing client information.
 """
 
+import asyncio
 import csv
 import re
 import hashlib
@@ -16,25 +17,56 @@ import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional
 
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
-import asyncio
+try:
+    import orjson
+except ImportError:  # optional: faster JSON serialization when installed
+    orjson = None
+
+try:
+    import pandas as pd
+except ImportError:  # optional: C-engine CSV parsing when installed
+    pd = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:  # optional: multi-threaded CSV parsing when installed
+    pa = pc = pacsv = None
 
 from geocode_cache_manager import _GeocodeCacheManager
+from ukraine_settlements import lookup_settlement
 
 load_dotenv()
 
-try:
-    from notion_client import Client
-except ImportError:
-    Client = None
-
+_NOTION_API_URL = "https://api.notion.com/v1"
+_NOTION_VERSION = "2022-06-28"
+# Notion allows about 3 requests/s per integration: cap requests in flight
+# and honour Retry-After on 429 instead of failing the whole fetch.
+_NOTION_MAX_CONCURRENCY = 3
+_NOTION_MAX_RETRIES = 5
 
 _geocode_cache_manager = _GeocodeCacheManager()
+# Writer lock for the geocode cache. Reads (`_geocode_cache_manager.get`) stay
+# lock-free: a single dict lookup is atomic under the GIL, so concurrent
+# readers never contend. Hold the lock for `set` and for `_save_geocode_cache`,
+# which iterates the dict and must not race with inserts.
 _GEOCODE_CACHE_LOCK = threading.Lock()
 
+# Failed lookups are cached as {"lat": None, "lng": None, "failed_at": ts} and
+# skipped for this long, so unresolvable addresses don't cost a full round of
+# HTTP timeouts on every refresh but still get retried eventually.
+_GEOCODE_NEG_TTL = 24 * 60 * 60
+_GEOCODE_TIMEOUT = 5
+_GEOCODE_HIT, _GEOCODE_NEG, _GEOCODE_MISS = "hit", "neg", "miss"
+
 
 def _load_geocode_cache() -> None:
     _geocode_cache_manager.load()
@@ -44,80 +76,252 @@ def _save_geocode_cache() -> None:
     _geocode_cache_manager.save()
 
 
+def _flush_geocode_cache() -> None:
+    _geocode_cache_manager.flush()
+
+
+_WS_RE = re.compile(r"\s+")
+
+
+def _norm_place(s: str) -> str:
+    """Trim, lowercase and collapse whitespace in a place string."""
+    return _WS_RE.sub(" ", s.strip()).lower()
+
+
+_ADDR_KEY_PREFIX = "addr::"
+
+
 def _geocode_cache_key(q: str) -> str:
-    # Normalize query and return a short hash as key
+    # The normalized query is itself the key; no hashing per lookup
     if not isinstance(q, str):
         q = str(q)
-    norm = " ".join(q.strip().lower().split())
-    return hashlib.sha1(norm.encode("utf-8")).hexdigest()
-
-
-# TODO: This function here is a bottleneck for the entire script.
-# It loads entire database from Notion, and thus taking too much time.
-# Then the entire data is filtered in the code, so we waste a lot of time and power
-# to just get the neccessary data.
-async def fetch_notion_data(api_key, database_id):
-    """Fetch Notion data that matches the server-side filter."""
-    notion_filter = {"property": "Source", "select": {"equals": "БАЗА"}}
-
-    if not Client:
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Notion-Version": "2022-06-28",
-            "Content-Type": "application/json",
-        }
-        url = f"https://api.notion.com/v1/databases/{database_id}/query"
+    return _ADDR_KEY_PREFIX + _norm_place(q)
 
-        all_results = []
-        has_more = True
-        start_cursor = None
 
-        while has_more:
-            payload = {"filter": notion_filter}
-            if start_cursor:
-                payload["start_cursor"] = start_cursor
+def _cached_address(place: str):
+    """Return the address-level cache entry for `place`, or None.
 
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+    Caches written before keys were plain strings store addresses under the
+    SHA-1 hex digest of the normalized place. Such an entry is moved to its
+    new key on first read, so the digest is only computed on misses.
+    """
+    key = _geocode_cache_key(place)
+    entry = _geocode_cache_manager.get(key)
+    if entry is None:
+        legacy = hashlib.sha1(
+            key[len(_ADDR_KEY_PREFIX):].encode("utf-8")
+        ).hexdigest()
+        if _geocode_cache_manager.get(legacy) is not None:
+            with _GEOCODE_CACHE_LOCK:
+                entry = _geocode_cache_manager.rename(legacy, key)
+    return entry
+
+
+def _cached_geocode(place: str) -> tuple[str, Optional[dict]]:
+    """Look up an address in the geocode cache.
+
+    Returns (_GEOCODE_HIT, coords), (_GEOCODE_NEG, None) for a failure cached
+    less than _GEOCODE_NEG_TTL seconds ago, or (_GEOCODE_MISS, None).
+    """
+    cached = _cached_address(place)
+    if not cached:
+        return _GEOCODE_MISS, None
+    if isinstance(cached, dict) and cached.get("lat") is None:
+        failed_at = cached.get("failed_at") or 0
+        if failed_at > time.time() - _GEOCODE_NEG_TTL:
+            return _GEOCODE_NEG, None
+        return _GEOCODE_MISS, None
+    return _GEOCODE_HIT, cached
+
+
+def _remember_geocode_failure(place: str) -> None:
+    """Cache a failed lookup so it is skipped until the negative TTL expires."""
+    with _GEOCODE_CACHE_LOCK:
+        _geocode_cache_manager.set(
+            _geocode_cache_key(place),
+            {"lat": None, "lng": None, "failed_at": time.time()},
+        )
 
-            paged_results = data.get("results", [])
-            all_results.extend(paged_results)
 
-            has_more = data.get("has_more", False)
-            start_cursor = data.get("next_cursor")
+def _geocode_session() -> requests.Session:
+    """Create a geocoding HTTP session with bounded retries."""
+    session = requests.Session()
+    session.headers.update({"User-Agent": "NotionMapWidget/1.0"})
+    adapter = HTTPAdapter(max_retries=Retry(total=2, backoff_factor=1))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
-        return {"results": all_results}
 
-    client = Client(auth=api_key)
-    all_results: list = []
-    start_cursor = None
+_NOMINATIM_SESSION = _geocode_session()
+
+
+# Default server-side filter: only entries with Source = "БАЗА" are rendered on
+# the map. It is written for a select column; iter_notion_pages rewrites it to
+# the column's actual type (rich_text, status). Override with NOTION_FILTER_JSON.
+_DEFAULT_NOTION_FILTER = {"property": "Source", "select": {"equals": "БАЗА"}}
+
+
+def _notion_source_filter() -> dict:
+    """Return the Notion query filter used to select map clients."""
+    raw = os.environ.get("NOTION_FILTER_JSON")
+    if raw:
+        try:
+            return json.loads(raw)
+        except ValueError:
+            print("⚠ Warning: NOTION_FILTER_JSON is not valid JSON, using default filter.")
+    return _DEFAULT_NOTION_FILTER
+
+
+async def _notion_request(session, sem, method, url, **kwargs) -> dict:
+    """Send one Notion API request under `sem`, retrying rate-limited ones.
+
+    A 429 response is retried after its Retry-After delay (1 s if absent),
+    up to `_NOTION_MAX_RETRIES` times. The semaphore is released while
+    waiting so other requests are not held up by the sleep.
+    """
+    for attempt in range(_NOTION_MAX_RETRIES + 1):
+        async with sem:
+            async with session.request(method, url, **kwargs) as response:
+                if response.status != 429 or attempt == _NOTION_MAX_RETRIES:
+                    response.raise_for_status()
+                    return await response.json()
+                try:
+                    delay = float(response.headers.get("Retry-After", 1))
+                except ValueError:
+                    delay = 1.0
+        print(f"⚠ Notion rate limit hit, retrying in {delay:g}s")
+        await asyncio.sleep(delay)
 
-    # The official notion_client can be async or sync depending on version.
-    # Call the query method and `await` only if it returns a coroutine.
-    resp = client.databases.query(
-        database_id=database_id, filter=notion_filter, start_cursor=start_cursor
-    )
-    if asyncio.iscoroutine(resp):
-        response = await resp
-    else:
-        response = resp
 
-    all_results.extend(response.get("results", []))
-    start_cursor = response.get("next_cursor")
+# Property name -> {"id", "type"} per database, resolved once per process.
+_NOTION_PROPERTIES: dict[str, dict[str, dict]] = {}
 
-    while response.get("has_more"):
-        resp = client.databases.query(
-            database_id=database_id, filter=notion_filter, start_cursor=start_cursor
+
+async def _notion_properties(session, sem, database_id) -> dict[str, dict]:
+    """Return the database's property name -> {"id", "type"} map, fetching it once."""
+    props = _NOTION_PROPERTIES.get(database_id)
+    if props is None:
+        data = await _notion_request(
+            session, sem, "GET", f"{_NOTION_API_URL}/databases/{database_id}"
         )
-        if asyncio.iscoroutine(resp):
-            response = await resp
-        else:
-            response = resp
+        props = {
+            name: {"id": prop["id"], "type": prop.get("type")}
+            for name, prop in data.get("properties", {}).items()
+            if prop.get("id")
+        }
+        _NOTION_PROPERTIES[database_id] = props
+    return props
+
+
+# Property types whose `equals` filter conditions are interchangeable
+_EQUALS_FILTER_TYPES = ("select", "status", "rich_text")
+
+
+def _match_filter_types(filter_, props: dict):
+    """Rewrite `equals` conditions in `filter_` to each property's real type.
+
+    A `{"property": "Source", "select": {"equals": ...}}` condition on a
+    rich_text or status column is rejected by Notion with a 400, so it is
+    moved under that type's key. Compound `and`/`or` filters are walked.
+    """
+    if not isinstance(filter_, dict):
+        return filter_
+    for group in ("and", "or"):
+        if isinstance(filter_.get(group), list):
+            return {
+                **filter_,
+                group: [_match_filter_types(f, props) for f in filter_[group]],
+            }
+    kind = (props.get(filter_.get("property")) or {}).get("type")
+    if kind not in _EQUALS_FILTER_TYPES or kind in filter_:
+        return filter_
+    for other in _EQUALS_FILTER_TYPES:
+        cond = filter_.get(other)
+        if isinstance(cond, dict) and list(cond) == ["equals"]:
+            matched = {k: v for k, v in filter_.items() if k != other}
+            matched[kind] = cond
+            return matched
+    return filter_
+
+
+async def iter_notion_pages(
+    api_key, database_id, filter_=None, filter_properties=None
+):
+    """Yield a Notion database query one result page (up to 100 rows) at a time.
+
+    `filter_` is passed through as the query `filter` object so Notion only
+    returns matching rows instead of the whole database. `filter_properties`
+    is a list of property names; when given, pages only carry those
+    properties. The request for the next cursor is already in flight while
+    the caller processes the current page. Requests go through
+    `_notion_request`, so rate-limited ones are retried. `equals` conditions
+    in the filter are matched to the schema's property types (see
+    `_match_filter_types`).
+    """
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Notion-Version": _NOTION_VERSION,
+        "Content-Type": "application/json",
+    }
+    url = f"{_NOTION_API_URL}/databases/{database_id}/query"
+
+    base_payload: dict = {"page_size": 100}
+
+    connector = aiohttp.TCPConnector(limit=4)
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(
+        headers=headers, connector=connector, timeout=timeout
+    ) as session:
+        sem = asyncio.Semaphore(_NOTION_MAX_CONCURRENCY)
+        params = None
+        if filter_ is not None or filter_properties:
+            props = await _notion_properties(session, sem, database_id)
+            if filter_ is not None:
+                base_payload["filter"] = _match_filter_types(filter_, props)
+            if filter_properties:
+                # Unknown names are skipped; an empty projection returns everything
+                params = [
+                    ("filter_properties", props[name]["id"])
+                    for name in filter_properties
+                    if name in props
+                ] or None
+
+        async def _query(cursor):
+            payload = dict(base_payload)
+            if cursor:
+                payload["start_cursor"] = cursor
+            return await _notion_request(
+                session, sem, "POST", url, json=payload, params=params
+            )
+
+        task = asyncio.create_task(_query(None))
+        try:
+            while task is not None:
+                data = await task
+                task = None
+                if data.get("has_more"):
+                    task = asyncio.create_task(_query(data.get("next_cursor")))
+                    # Let the prefetch send its request before we hand control back
+                    await asyncio.sleep(0)
+                yield data.get("results", [])
+        finally:
+            if task is not None:
+                task.cancel()
+
 
-        all_results.extend(response.get("results", []))
-        start_cursor = response.get("next_cursor")
+async def fetch_notion_data(
+    api_key, database_id, filter_=None, filter_properties=None
+):
+    """Fetch all pages of a Notion database, optionally filtered server-side.
 
+    See `iter_notion_pages` for the arguments; this collects every result.
+    """
+    all_results: list = []
+    async for results in iter_notion_pages(
+        api_key, database_id, filter_=filter_, filter_properties=filter_properties
+    ):
+        all_results.extend(results)
     return {"results": all_results}
 
 
@@ -147,6 +351,10 @@ def _is_ukrainian_address(addr: str) -> bool:
     return bool(_UA_ADDRESS_RE.search(addr))
 
 
+# Abbreviations geocode_location strips from each address part, in one pass
+_ADDR_ABBREV_RE = re.compile(r" обл\.| р-н|смт\. |с\. |м\. ")
+
+
 def geocode_location(location_str: str):
     """
     Geocode a location string to lat/lng coordinates.
@@ -163,6 +371,12 @@ def geocode_location(location_str: str):
     if not location_str or not location_str.strip():
         return None
 
+    state, cached = _cached_geocode(location_str)
+    if state == _GEOCODE_HIT:
+        return cached
+    if state == _GEOCODE_NEG:
+        return None
+
     is_ua = _is_ukrainian_address(location_str)
 
     # Parse Ukrainian address format
@@ -171,13 +385,7 @@ def geocode_location(location_str: str):
 
     for part in parts:
         # Clean Ukrainian address abbreviations
-        cleaned = part
-        cleaned = cleaned.replace(" обл.", "")
-        cleaned = cleaned.replace(" р-н", "")
-        cleaned = cleaned.replace("с. ", "")
-        cleaned = cleaned.replace("м. ", "")
-        cleaned = cleaned.replace("смт. ", "")
-        cleaned = cleaned.strip()
+        cleaned = _ADDR_ABBREV_RE.sub("", part).strip()
         if cleaned:
             search_terms.append(cleaned)
 
@@ -205,20 +413,25 @@ def geocode_location(location_str: str):
             }
             if is_ua:
                 params["countrycodes"] = "ua"  # Limit to Ukraine only for UA addresses
-            headers = {"User-Agent": "NotionMapWidget/1.0"}
 
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            response = _NOMINATIM_SESSION.get(
+                url, params=params, timeout=_GEOCODE_TIMEOUT
+            )
             response.raise_for_status()
             data = response.json()
 
             if data and len(data) > 0:
                 result = data[0]
-                return {"lat": float(result["lat"]), "lng": float(result["lon"])}
+                coords = {"lat": float(result["lat"]), "lng": float(result["lon"])}
+                with _GEOCODE_CACHE_LOCK:
+                    _geocode_cache_manager.set(_geocode_cache_key(location_str), coords)
+                return coords
 
         except (requests.RequestException, ValueError) as e:
             print(f"  Geocoding error for '{query}': {e}")
             # Continue to next search term
 
+    _remember_geocode_failure(location_str)
     return None
 
 
@@ -274,6 +487,18 @@ def _parse_ukrainian_address(addr: str) -> dict:
     return result
 
 
+def _is_settlement_level(addr: str, parsed: dict) -> bool:
+    """True if `addr` names no more than a settlement, raion and oblast.
+
+    For such addresses a street-level free-text search cannot be more
+    precise than a structured settlement query.
+    """
+    parts = sum(1 for p in addr.split(",") if p.strip())
+    return bool(parsed["settlement"]) and parts <= sum(
+        1 for v in parsed.values() if v
+    )
+
+
 def batch_geocode(
     addresses: list[str],
     max_workers: int = 4,
@@ -302,7 +527,7 @@ def batch_geocode(
     for a in addresses:
         if not isinstance(a, str):
             a = str(a)
-        norm = " ".join(a.strip().lower().split())
+        norm = _norm_place(a)
         if norm in seen:
             continue
         seen.add(norm)
@@ -314,12 +539,13 @@ def batch_geocode(
 
     results: dict = {}
     to_query: list[str] = []
-    # Fill results from cache where available
+    # Fill results from cache where available; recent failures are skipped
     for a in uniq:
-        key = _geocode_cache_key(a)
-        cached = _geocode_cache_manager.get(key)
-        if cached:
+        state, cached = _cached_geocode(a)
+        if state == _GEOCODE_HIT:
             results[a] = cached
+        elif state == _GEOCODE_NEG:
+            results[a] = None
         else:
             to_query.append(a)
 
@@ -331,30 +557,25 @@ def batch_geocode(
 
     def get_session():
         if not hasattr(thread_local, "session"):
-            s = requests.Session()
-            s.headers.update({"User-Agent": "NotionMapWidget/1.0"})
-            thread_local.session = s
+            thread_local.session = _geocode_session()
         return thread_local.session
 
-    # Token-bucket rate limiter
-    bucket = {"tokens": float(burst), "last": time.time()}
-    bucket_lock = threading.Lock()
+    # Rate limiter: each request takes the next send slot, 1/rate apart, and
+    # sleeps once until it is due. Slots may lag up to `burst` - 1 intervals
+    # behind now, so after idle time `burst` requests go out at once.
+    interval = 1.0 / rate
+    slack = (max(1, burst) - 1) * interval
+    next_slot = [time.monotonic() - slack]
+    slot_lock = threading.Lock()
 
     def acquire_token():
-        while True:
-            with bucket_lock:
-                now = time.time()
-                elapsed = now - bucket["last"]
-                # refill tokens
-                refill = elapsed * rate
-                if refill > 0:
-                    bucket["tokens"] = min(float(burst), bucket["tokens"] + refill)
-                    bucket["last"] = now
-                if bucket["tokens"] >= 1.0:
-                    bucket["tokens"] -= 1.0
-                    return
-            # sleep briefly before next check (non-busy wait)
-            time.sleep(max(0.01, 1.0 / (rate * 4)))
+        with slot_lock:
+            now = time.monotonic()
+            slot = max(next_slot[0], now - slack)
+            next_slot[0] = slot + interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
 
     # Check for Google Maps API Key
     google_api_key = os.environ.get("GOOGLE_MAPS_API_KEY")
@@ -366,10 +587,11 @@ def batch_geocode(
 
     def worker(addr: str):
         # double-check cache (in case another thread saved it)
-        key = _geocode_cache_key(addr)
-        cached = _geocode_cache_manager.get(key)
-        if cached:
+        state, cached = _cached_geocode(addr)
+        if state == _GEOCODE_HIT:
             return addr, cached
+        if state == _GEOCODE_NEG:
+            return addr, None
 
         # Detect address language to decide whether to restrict geocoding to Ukraine
         is_ua = _is_ukrainian_address(addr)
@@ -380,6 +602,48 @@ def batch_geocode(
         oblast = parsed.get("oblast", "")
         raion = parsed.get("raion", "")
 
+        session = get_session()
+
+        def structured_lookup():
+            acquire_token()
+            try:
+                struct_params: dict = {
+                    "format": "json",
+                    "limit": 1,
+                    "city": settlement,
+                }
+                if is_ua:
+                    struct_params["countrycodes"] = "ua"
+                if oblast and is_ua:
+                    struct_params["state"] = oblast + " область"
+                resp = session.get(
+                    url_nominatim, params=struct_params, timeout=_GEOCODE_TIMEOUT
+                )
+                resp.raise_for_status()
+                data = resp.json()
+                if data and len(data) > 0:
+                    r = data[0]
+                    return {"lat": float(r["lat"]), "lng": float(r["lon"])}
+            except (
+                requests.RequestException,
+                OSError,
+                PermissionError,
+                ValueError,
+                TypeError,
+                IOError,
+            ):
+                pass
+            return None
+
+        # Settlement-only addresses ("Київська обл., ..., с. Андріївка") are
+        # resolved by one structured query (city + oblast) when it hits,
+        # instead of walking the free-text variants below first
+        settlement_level = is_ua and _is_settlement_level(addr, parsed)
+        if settlement_level:
+            coords = structured_lookup()
+            if coords:
+                return addr, coords
+
         queries = []
 
         # 1. Try more specific (street-level) queries first
@@ -466,8 +730,6 @@ def batch_geocode(
                 unique_queries.append(q)
                 seen_q.add(q)
 
-        session = get_session()
-
         # Try each query with Google (if available), then Nominatim as fallback
         for q in unique_queries:
             acquire_token()
@@ -477,7 +739,9 @@ def batch_geocode(
                 if google_api_key:
                     # Google Maps Geocoding
                     params = {"address": q, "key": google_api_key, "language": "uk"}
-                    resp = session.get(url_google, params=params, timeout=10)
+                    resp = session.get(
+                        url_google, params=params, timeout=_GEOCODE_TIMEOUT
+                    )
                     resp.raise_for_status()
                     data = resp.json()
 
@@ -497,7 +761,9 @@ def batch_geocode(
                     if is_ua:
                         nominatim_params["countrycodes"] = "ua"
                     resp = session.get(
-                        url_nominatim, params=nominatim_params, timeout=10
+                        url_nominatim,
+                        params=nominatim_params,
+                        timeout=_GEOCODE_TIMEOUT,
                     )
                     resp.raise_for_status()
                     data = resp.json()
@@ -520,34 +786,16 @@ def batch_geocode(
                 continue
 
         # Last resort: structured Nominatim query (most reliable for Ukrainian / any address)
-        if settlement:
-            acquire_token()
-            try:
-                struct_params: dict = {
-                    "format": "json",
-                    "limit": 1,
-                    "city": settlement,
-                }
-                if is_ua:
-                    struct_params["countrycodes"] = "ua"
-                if oblast and is_ua:
-                    struct_params["state"] = oblast + " область"
-                resp = session.get(url_nominatim, params=struct_params, timeout=10)
-                resp.raise_for_status()
-                data = resp.json()
-                if data and len(data) > 0:
-                    r = data[0]
-                    coords = {"lat": float(r["lat"]), "lng": float(r["lon"])}
-                    return addr, coords
-            except (
-                requests.RequestException,
-                OSError,
-                PermissionError,
-                ValueError,
-                TypeError,
-                IOError,
-            ):
-                pass
+        if settlement and not settlement_level:
+            coords = structured_lookup()
+            if coords:
+                return addr, coords
+
+        # Curated coordinates for settlements the services struggle with
+        if is_ua:
+            coords = lookup_settlement(addr)
+            if coords:
+                return addr, coords
 
         # No results found after all attempts
         return addr, None
@@ -570,33 +818,31 @@ def batch_geocode(
         completed = 0
         try:
             for fut in as_completed(futures):
-                a = futures[fut]
                 try:
-                    result = fut.result()
-                    if result is not None:
-                        addr, coords = result
-                    else:
-                        addr, coords = a, None
-                except (TimeoutError, ConnectionError, ValueError, KeyError):
-                    addr, coords = a, None
-
-                # Store result
-                if coords:
-                    results[addr] = coords
-                else:
-                    results[addr] = None
+                    addr, coords = fut.result()
+                except Exception:
+                    # One failing address must not abort the rest of the batch
+                    addr, coords = futures[fut], None
 
-                # Save only successful results to cache (don't cache failures)
-                if coords:
+                if not coords:
+                    results[addr] = None
+                    # Failures are cached as short-lived negatives
+                    try:
+                        _remember_geocode_failure(addr)
+                    except (ValueError, TypeError):
+                        print("Could not update geocode cache on disk.")
+                else:
+                    results[addr] = coords
                     try:
                         key = _geocode_cache_key(addr)
                         with _GEOCODE_CACHE_LOCK:
                             _geocode_cache_manager.set(key, coords)
                             success_count += 1
 
-                            # Periodically flush to disk to avoid losing progress
+                            # Periodically checkpoint new entries to the journal
+                            # (appends only; the full rewrite happens once below)
                             if autosave_every and success_count % autosave_every == 0:
-                                _save_geocode_cache()
+                                _flush_geocode_cache()
 
                     except (ValueError, TypeError, OSError, PermissionError, IOError):
                         print("Could not update geocode cache on disk.")
@@ -626,6 +872,92 @@ def batch_geocode(
     return results
 
 
+def _read_csv_arrow(text: str, delimiter: str):
+    """Parse a whole CSV with pyarrow's multi-threaded reader.
+
+    Every column is read as a string (no type inference, so phone numbers
+    keep their leading zeros) and trimmed with an Arrow kernel. Returns
+    (header, rows).
+    """
+    data = text.encode("utf-8")
+    # The header is parsed by the csv module (handles CRLF and quoting); Arrow
+    # skips it and names columns f0, f1, ... so the forced string types always
+    # match, whatever the header text looks like.
+    header = next(csv.reader(io.StringIO(text), delimiter=delimiter), [])
+    table = pacsv.read_csv(
+        io.BytesIO(data),
+        read_options=pacsv.ReadOptions(
+            use_threads=True,
+            block_size=1 << 20,
+            skip_rows=1,
+            autogenerate_column_names=True,
+        ),
+        # Only quoted values can contain newlines; without any quotes the
+        # reader may split blocks at any newline and parse them in parallel
+        parse_options=pacsv.ParseOptions(
+            delimiter=delimiter, newlines_in_values='"' in text
+        ),
+        convert_options=pacsv.ConvertOptions(
+            column_types={f"f{i}": pa.string() for i in range(len(header))},
+            strings_can_be_null=False,
+        ),
+    )
+    columns = [
+        pc.utf8_trim_whitespace(col).to_pylist() for col in table.itercolumns()
+    ]
+    if len(columns) != len(header):
+        raise ValueError("CSV rows do not match the header width")
+    return header, zip(*columns)
+
+
+def _iter_csv_chunks(text: str, delimiter: str):
+    """Yield (header, rows) chunks of a CSV; every value is a stripped str.
+
+    Prefers pyarrow's multi-threaded reader, then pandas' C parser in
+    10k-row chunks, whichever is installed, and falls back to the stdlib
+    `csv` module (also for files they reject, such as ragged rows).
+    """
+    if pacsv is not None:
+        try:
+            yield _read_csv_arrow(text, delimiter)
+            return
+        except (pa.ArrowException, ValueError):
+            pass  # fall through to the next parser
+
+    if pd is not None:
+        try:
+            chunks = []
+            for chunk in pd.read_csv(
+                io.StringIO(text),
+                sep=delimiter,
+                index_col=False,  # never promote a column to the index
+                dtype=str,
+                na_filter=False,
+                keep_default_na=False,
+                engine="c",
+                chunksize=10_000,
+            ):
+                chunk = chunk.fillna("")
+                for col in chunk.columns:
+                    chunk[col] = chunk[col].str.strip()
+                chunks.append(
+                    (list(chunk.columns), chunk.itertuples(index=False, name=None))
+                )
+            yield from chunks
+            return
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, ValueError):
+            pass  # fall back to the tolerant stdlib reader
+
+    reader = csv.reader(io.StringIO(text), delimiter=delimiter)
+    header = next(reader, None)
+    if header is None:
+        return
+    width = len(header)
+    yield header, (
+        [v.strip() for v in row[:width]] for row in reader if row
+    )
+
+
 def parse_csv_to_clients(
     file_bytes: bytes, geocode: bool = True, max_geocode: Optional[int] = None
 ) -> list[dict]:
@@ -655,8 +987,6 @@ def parse_csv_to_clients(
     # Detect delimiter: prefer semicolon if present in sample, else comma
     delimiter = ";" if ";" in sample and sample.count(";") >= sample.count(",") else ","
 
-    reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
-
     name_keys = {"name", "покупець", "пІб", "пиб", "client", "клієнт", "ПОКУПЕЦЬ"}
     addr_keys = {"address", "адреса", "адреса_1", "place", "адреса1", "АДРЕСА"}
     lat_keys = {"lat", "latitude", "широта"}
@@ -675,83 +1005,81 @@ def parse_csv_to_clients(
     addr_seen: set = set()
     addresses: list[str] = []
 
-    for row in reader:
-        # Normalize row keys to lowercase without surrounding spaces
-        norm_row = {}
-        for k, v in row.items():
-            # normalize key
-            key = k or ""
-            if not isinstance(key, str):
-                key = str(key)
-            key = key.strip()
-
-            # normalize value; handle lists and non-strings safely
-            if isinstance(v, list):
-                val = ",".join(str(x) for x in v)
-            else:
-                val = v or ""
-                if not isinstance(val, str):
-                    val = str(val)
-            val = val.strip()
-
-            norm_row[key] = val
-
-        def find_first(keys: set, row: dict) -> Optional[str]:
-            """Find first non-empty value for any of the given keys in the row."""
-            lower_map = {k.lower(): v for k, v in row.items()}
-
-            for k in keys:
-                if k in lower_map and lower_map[k]:
-                    return lower_map[k]
-            return None
+    for header, rows in _iter_csv_chunks(text, delimiter):
+        # Resolve each field to its candidate columns once per header rather
+        # than per row; keys match case-insensitively, last duplicate wins
+        col_of = {str(h).strip().lower(): i for i, h in enumerate(header)}
+
+        def columns(keys: set) -> tuple:
+            return tuple(col_of[k] for k in keys if k in col_of)
+
+        name_cols = columns(name_keys)
+        addr_cols = columns(addr_keys)
+        lat_cols = columns(lat_keys)
+        lng_cols = columns(lng_keys)
+        phone_cols = columns(phone_keys)
+        email_cols = columns(email_keys)
+        notes_cols = columns(notes_keys)
+        label_cols = columns(label_keys)
+        org_cols = columns(org_keys)
+
+        for row in rows:
+            n = len(row)
+
+            def find_first(cols: tuple) -> Optional[str]:
+                """Return the first non-empty value among `cols` in this row."""
+                for i in cols:
+                    if i < n and row[i]:
+                        return row[i]
+                return None
 
-        name = find_first(name_keys, norm_row) or "Unnamed"
-        address = find_first(addr_keys, norm_row)
-        phone = find_first(phone_keys, norm_row)
-        email = find_first(email_keys, norm_row)
-        notes = find_first(notes_keys, norm_row)
-        label = find_first(label_keys, norm_row)
-        org = find_first(org_keys, norm_row)
+            name = find_first(name_cols) or "Unnamed"
+            address = find_first(addr_cols)
+            phone = find_first(phone_cols)
+            email = find_first(email_cols)
+            notes = find_first(notes_cols)
+            label = find_first(label_cols)
+            org = find_first(org_cols)
 
-        lat_raw = find_first(lat_keys, norm_row)
-        lng_raw = find_first(lng_keys, norm_row)
+            lat_raw = find_first(lat_cols)
+            lng_raw = find_first(lng_cols)
 
-        lat = None
-        lng = None
+            lat = None
+            lng = None
 
-        if lat_raw and lng_raw:
-            try:
-                lat = float(lat_raw.replace(",", "."))
-                lng = float(lng_raw.replace(",", "."))
-            except (TypeError, ValueError, AttributeError):
-                lat = None
-                lng = None
-
-        client = {
-            "name": name,
-            "color": "#ef4444",
-            "phone": phone,
-            "email": email,
-            "contact": "",
-            "address": address,
-            "notes": notes,
-            "label": label,
-            "orgTitle": org,
-        }
+            if lat_raw and lng_raw:
+                try:
+                    lat = float(lat_raw.replace(",", "."))
+                    lng = float(lng_raw.replace(",", "."))
+                except (TypeError, ValueError, AttributeError):
+                    lat = None
+                    lng = None
+
+            client = {
+                "name": name,
+                "color": "#ef4444",
+                "phone": phone,
+                "email": email,
+                "contact": "",
+                "address": address,
+                "notes": notes,
+                "label": label,
+                "orgTitle": org,
+            }
 
-        if lat is not None and lng is not None:
-            client["lat"] = lat
-            client["lng"] = lng
-            clients.append(client)
-            continue
+            if lat is not None and lng is not None:
+                client["lat"] = lat
+                client["lng"] = lng
+                clients.append(client)
+                continue
 
-        # If we have an address and geocoding is allowed, try geocoding
-        if address and geocode:
-            pending.append((client, address))
-            if address not in addr_seen:
-                addr_seen.add(address)
-                addresses.append(address)
-            continue
+            # If we have an address and geocoding is allowed, try geocoding
+            if address and geocode:
+                pending.append((client, address))
+                if address not in addr_seen:
+                    addr_seen.add(address)
+                    addresses.append(address)
+                continue
 
     # Perform batch geocoding for collected addresses (respect max_geocode)
     max_req = max_geocode if max_geocode is not None else None
@@ -897,3 +1225,107 @@ def merge_clients(
         merged.append(c)
 
     return merged
+
+
+def json_dumps(value) -> str:
+    """Serialize `value` to compact, non-ASCII-escaped JSON text.
+
+    Uses orjson when installed, otherwise the stdlib encoder with the same
+    output shape.
+    """
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def json_loads(data):
+    """Parse JSON from `bytes` or `str`, with orjson when installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Fields the map widget displays for each client, in column order. Phone,
+# email and contact are only searched, so they ship inside "_s" alone.
+CLIENT_COLUMNS = (
+    "name",
+    "lat",
+    "lng",
+    "color",
+    "address",
+    "notes",
+    "label",
+)
+
+
+# Fields joined into each client's lowercase search text ("_s" column).
+_SEARCH_FIELDS = ("name", "address", "contact", "phone", "email")
+
+
+def client_search_text(client: dict) -> str:
+    """Return the lowercase text the widget search matches against."""
+    return " ".join(filter(None, (client.get(f) for f in _SEARCH_FIELDS))).lower()
+
+
+def located_clients(clients: list[dict]) -> tuple[list[dict], Optional[list[list[float]]]]:
+    """Split out clients that have both coordinates, in one pass.
+
+    Returns (located, bounds), where bounds is
+    [[min_lng, min_lat], [max_lng, max_lat]] over `located`, or None when
+    it is empty.
+    """
+    located = []
+    append = located.append
+    min_lat = min_lng = float("inf")
+    max_lat = max_lng = float("-inf")
+    for c in clients:
+        lat, lng = c.get("lat"), c.get("lng")
+        if lat is None or lng is None:
+            continue
+        append(c)
+        if lat < min_lat:
+            min_lat = lat
+        if lat > max_lat:
+            max_lat = lat
+        if lng < min_lng:
+            min_lng = lng
+        if lng > max_lng:
+            max_lng = lng
+    if not located:
+        return located, None
+    return located, [[min_lng, min_lat], [max_lng, max_lat]]
+
+
+def client_bounds(clients: list[dict]) -> Optional[list[list[float]]]:
+    """Return [[min_lng, min_lat], [max_lng, max_lat]] over located clients.
+
+    Returns None when no client has both coordinates.
+    """
+    return located_clients(clients)[1]
+
+
+# Decimal places kept for widget coordinates (~0.1 m), instead of the
+# 15-17 significant digits a geocoder float serializes to.
+_COORD_DECIMALS = 6
+
+
+def iter_client_columns(clients: list[dict]):
+    """Yield (field, values) for each widget column, plus the "_s" search text."""
+    for field in CLIENT_COLUMNS:
+        if field in ("lat", "lng"):
+            yield field, [
+                None if (v := c.get(field)) is None else round(v, _COORD_DECIMALS)
+                for c in clients
+            ]
+        else:
+            yield field, [c.get(field) for c in clients]
+    yield "_s", [client_search_text(c) for c in clients]
+
+
+def clients_to_columns(clients: list[dict]) -> dict:
+    """Convert a list of client dicts into parallel arrays keyed by field.
+
+    The columnar form serializes without repeating every key per client,
+    which roughly halves the JSON embedded in the widget.
+    """
+    return dict(iter_client_columns(clients))
@@ -44,6 +44,10 @@ HEADERS = {
 }
 BASE = "https://www.notion.so/api/v3"
 
+# One keep-alive session for the whole pagination/restore walk
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+
 
 def fetch_trash() -> list[dict]:
     results, cursor = [], None
@@ -67,7 +71,7 @@ def fetch_trash() -> list[dict]:
         if cursor:
             body["startCursor"] = cursor
 
-        resp = requests.post(f"{BASE}/search", headers=HEADERS, json=body)
+        resp = SESSION.post(f"{BASE}/search", json=body)
         if resp.status_code != 200:
             print(f"ERROR /search {resp.status_code}:\n{resp.text[:600]}")
             sys.exit(1)
@@ -96,9 +100,8 @@ def get_title(item: dict) -> str:
 def restore_pages(ids: list[str]) -> bool:
     for i in range(0, len(ids), 100):
         batch = ids[i:i+100]
-        resp = requests.post(
+        resp = SESSION.post(
             f"{BASE}/restoreBlocks",
-            headers=HEADERS,
             json={"blockIds": batch, "spaceId": SPACE_UUID},
         )
         if resp.status_code != 200: